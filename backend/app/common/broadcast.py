@@ -0,0 +1,102 @@
+from asyncio import Queue, QueueFull
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+
+from app.common.versions import CollectionVersions
+from app.models.cells_db import Cell
+
+CellState = dict[str, Any]
+
+CELL_FIELDS: set[str] = set(Cell.__fields__) - {"id"}
+
+
+class CellSubscription:
+    def __init__(self, queue_size: int) -> None:
+        self.queue: Queue[CellState | None] = Queue(queue_size)
+        self.dropped: bool = False
+
+    def drop(self) -> None:
+        """Empties the queue and leaves only the end-of-stream marker in it"""
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class CellBroadcaster:
+    """
+    In-process fan-out of per-cell changes to stream subscribers
+
+    Remembers the last published state of every cell, so only fields
+    that actually changed are sent. Callers that know which fields they
+    assigned pass them, so the rest of the cell (like a long ``subjects``
+    list) isn't encoded again for every telemetry message. Subscribers that
+    fall more than ``queue_size`` diffs behind are dropped instead of slowing
+    down others.
+    With ``relay`` diffs are also collected for the other workers of a
+    cluster, which pass them to their own subscribers
+    """
+
+    def __init__(
+        self, queue_size: int, versions: CollectionVersions, relay: bool = False
+    ) -> None:
+        self.queue_size = queue_size
+        self.versions = versions
+        self.relay = relay
+        self.subscriptions: set[CellSubscription] = set()
+        self.states: dict[str, CellState] = {}
+        self.outgoing: list[CellState] = []
+
+    def subscribe(self) -> CellSubscription:
+        subscription = CellSubscription(self.queue_size)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: CellSubscription) -> None:
+        self.subscriptions.discard(subscription)
+
+    def compare(self, cell: Cell, fields: set[str]) -> CellState:
+        """Fields that differ from the last published state, which is updated"""
+        state: CellState = jsonable_encoder(cell.dict(include=fields))
+        previous = self.states.setdefault(str(cell.id), {})
+        changes = {
+            name: value
+            for name, value in state.items()
+            if name not in previous or previous[name] != value
+        }
+        previous.update(changes)
+        return changes
+
+    def publish(self, cell: Cell, fields: set[str] | None = None) -> None:
+        """Sends changes of the cell, only ``fields`` are compared if given"""
+        include = CELL_FIELDS if fields is None else fields - {"id"}
+        changes = self.compare(cell, include) if include else {}
+        if not changes:
+            return
+
+        diff: CellState = {"type": "diff", "id": str(cell.id), "changes": changes}
+        if self.relay:
+            self.outgoing.append(diff)
+        self.versions.apply([Cell.__name__])  # other workers bump on the diff
+        self.fan_out(diff)
+
+    def receive(self, diffs: list[CellState]) -> None:
+        """Takes diffs relayed by another worker"""
+        for diff in diffs:
+            self.states.setdefault(diff["id"], {}).update(diff["changes"])
+            self.versions.apply([Cell.__name__])
+            self.fan_out(diff)
+
+    def drain(self) -> list[CellState]:
+        outgoing = self.outgoing.copy()
+        self.outgoing.clear()
+        return outgoing
+
+    def fan_out(self, diff: CellState) -> None:
+        for subscription in list(self.subscriptions):
+            try:
+                subscription.queue.put_nowait(diff)
+            except QueueFull:
+                self.unsubscribe(subscription)
+                subscription.drop()
@@ -0,0 +1,99 @@
+import logging
+from asyncio import gather, sleep
+from time import monotonic
+
+from app.models.cells_db import Cell, ClimateMode
+from common.mqtt_service import MQTTService
+
+
+class ClimateController:
+    """
+    Decides climate modes from temperature readings and commands devices
+    only on transitions
+
+    Heating or cooling starts once the reading is ``deadband`` away from the
+    required temperature and stops once it is within ``hysteresis`` of it,
+    a commanded mode is kept for at least ``dwell`` seconds. Commands are
+    coalesced per device and published together once per ``interval``
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        mqtt_service: MQTTService,
+        deadband: float,
+        hysteresis: float,
+        dwell: float,
+        interval: float,
+    ) -> None:
+        self.mqtt_service = mqtt_service
+        self.deadband = deadband
+        self.hysteresis = hysteresis
+        self.dwell = dwell
+        self.interval = interval
+        self._modes: dict[str, tuple[ClimateMode, float]] = {}
+        self._pending: dict[str, ClimateMode] = {}
+
+    def decide(self, cell: Cell, value: float) -> ClimateMode | None:
+        if cell.required_temperature is None:
+            return ClimateMode.BROKEN
+        if value > cell.required_temperature + self.deadband:
+            return ClimateMode.COOLING
+        if value < cell.required_temperature - self.deadband:
+            return ClimateMode.HEATING
+        if abs(value - cell.required_temperature) <= self.hysteresis:
+            return ClimateMode.READY
+        return None
+
+    def update(self, device_id: str, cell: Cell, value: float) -> None:
+        climate_mode = self.decide(cell, value)
+        if climate_mode is None:
+            return
+
+        now = monotonic()
+        last = self._modes.get(device_id)
+        if last is not None:
+            last_mode, changed_at = last
+            if last_mode == climate_mode:
+                return
+            if climate_mode != ClimateMode.BROKEN and now - changed_at < self.dwell:
+                return
+
+        self._modes[device_id] = (climate_mode, now)
+        cell.climate_mode = climate_mode
+        if climate_mode == ClimateMode.BROKEN:
+            self._pending.pop(device_id, None)
+        else:
+            self._pending[device_id] = climate_mode
+
+    def forget(self, device_id: str) -> None:
+        """Makes the next reading command the device again"""
+        self._modes.pop(device_id, None)
+        self._pending.pop(device_id, None)
+
+    def reset(self) -> None:
+        self._modes = {}
+        self._pending = {}
+
+    async def flush(self) -> None:
+        if not self._pending or self.mqtt_service.client is None:
+            return
+        commands = self._pending
+        self._pending = {}
+        results = await gather(
+            *(
+                self.mqtt_service.publish(f"climate/{mode.value}/{device_id}", None)
+                for device_id, mode in commands.items()
+            ),
+            return_exceptions=True,
+        )
+        for device_id, result in zip(commands, results):
+            if isinstance(result, Exception):
+                logging.error(
+                    f"Climate command for {device_id} failed", exc_info=result
+                )
+                self._modes.pop(device_id, None)
+
+    async def run(self) -> None:
+        while True:  # noqa: WPS457
+            await sleep(self.interval)
+            await self.flush()
@@ -0,0 +1,121 @@
+import logging
+from asyncio import sleep
+from bisect import bisect
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import datetime, timedelta
+from hashlib import blake2b
+
+from odmantic import AIOEngine
+from pymongo.errors import PyMongoError
+
+from app.models.workers_db import HubWorker
+
+RebalanceCallback = Callable[[], Awaitable[None]]
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest())
+
+
+class HashRing:
+    """Consistent hashing of keys onto members, with virtual nodes"""
+
+    def __init__(self, members: Iterable[str], replicas: int = 64) -> None:
+        points = sorted(
+            (ring_hash(f"{member}/{replica}"), member)
+            for member in members
+            for replica in range(replicas)
+        )
+        self.hashes: list[int] = [point for point, _ in points]
+        self.members: list[str] = [member for _, member in points]
+
+    def owner(self, key: str) -> str | None:
+        if not self.hashes:
+            return None
+        return self.members[bisect(self.hashes, ring_hash(key)) % len(self.hashes)]
+
+
+class ClusterMembership:
+    """
+    Splits device ownership between the hub workers sharing one database
+
+    Every worker upserts a heartbeat and rebuilds the ring from the workers
+    seen alive within ``timeout``, rebalance callbacks run whenever that set
+    changes. When disabled the only worker owns every device
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        engine: AIOEngine,
+        worker_id: str,
+        enabled: bool,
+        interval: float,
+        timeout: float,
+    ) -> None:
+        self.engine = engine
+        self.worker_id = worker_id
+        self.enabled = enabled
+        self.interval = interval
+        self.timeout = timeout
+        self.members: frozenset[str] = frozenset((worker_id,))
+        self._ring: HashRing = HashRing(self.members)
+        self._callbacks: list[RebalanceCallback] = []
+
+    def is_owned(self, device_id: str) -> bool:
+        """Whether this worker owns the device"""
+        if not self.enabled:
+            return True
+        return self._ring.owner(device_id) == self.worker_id
+
+    def on_rebalance(self, callback: RebalanceCallback) -> RebalanceCallback:
+        """Registers a callback to run after the set of workers changes"""
+        self._callbacks.append(callback)
+        return callback
+
+    async def heartbeat(self) -> frozenset[str]:
+        """Returns the workers alive, this one included"""
+        now = datetime.utcnow()
+        collection = self.engine.get_collection(HubWorker)
+        await collection.update_one(
+            {"worker_id": self.worker_id}, {"$set": {"heartbeat": now}}, upsert=True
+        )
+        alive_since = now - timedelta(seconds=self.timeout)
+        await collection.delete_many({"heartbeat": {"$lt": alive_since}})
+        workers = await self.engine.find(HubWorker, HubWorker.heartbeat >= alive_since)
+        return frozenset((self.worker_id, *(w.worker_id for w in workers)))
+
+    def rebuild(self, members: frozenset[str]) -> None:
+        logging.info(f"Cluster members changed: {len(members)} workers")
+        self.members = members
+        self._ring = HashRing(members)
+
+    async def join(self) -> None:
+        if self.enabled:
+            self.rebuild(await self.heartbeat())
+
+    async def leave(self) -> None:
+        if self.enabled:
+            await self.engine.get_collection(HubWorker).delete_one(
+                {"worker_id": self.worker_id}
+            )
+
+    async def rebalance(self) -> None:
+        for callback in self._callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logging.error(f"Rebalance callback '{callback}' exited", exc_info=e)
+
+    async def run(self) -> None:
+        if not self.enabled:
+            return
+        while True:  # noqa: WPS457
+            await sleep(self.interval)
+            try:
+                members = await self.heartbeat()
+            except PyMongoError as e:
+                logging.error("Cluster heartbeat failed", exc_info=e)
+                continue
+            if members != self.members:
+                self.rebuild(members)
+                await self.rebalance()
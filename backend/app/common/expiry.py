@@ -0,0 +1,78 @@
+from collections.abc import Callable
+from datetime import datetime
+from heapq import heappop, heappush
+
+from odmantic import AIOEngine, query
+
+from app.models.devices_db import Device, DeviceStatus
+from common.metrics import Histogram
+
+ALIVE_STATUSES: tuple[DeviceStatus, ...] = (
+    DeviceStatus.READY,
+    DeviceStatus.PAIRING,
+    DeviceStatus.PAIRED,
+)
+
+
+class ExpiryScheduler:
+    """
+    In-process deadline heap of devices that have not been marked dead
+
+    Entries are rescheduled lazily: ``Device.mark_active`` only moves
+    ``device.expiry`` forward, so when the old deadline is reached the
+    scheduled instance is checked and pushed back with its current expiry
+    """
+
+    def __init__(self, precision: float) -> None:
+        self.precision = precision
+        self.heap: list[tuple[datetime, str]] = []
+        self.deadlines: dict[str, datetime] = {}
+        self.devices: dict[str, Device] = {}
+        self.sweep_duration: Histogram = Histogram()
+        self.expired: int = 0
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    async def load_from(
+        self,
+        engine: AIOEngine,
+        known: dict[str, Device],
+        owns: Callable[[str], bool],
+    ) -> None:
+        """Schedules every owned alive device, preferring instances from ``known``"""
+        self.heap.clear()
+        self.deadlines.clear()
+        self.devices.clear()
+
+        async for device in engine.find(
+            Device, query.in_(Device.status, list(ALIVE_STATUSES))
+        ):
+            if owns(device.device_id):
+                self.schedule(known.get(device.device_id, device))
+
+    def schedule(self, device: Device) -> None:
+        self.devices[device.device_id] = device
+        self.deadlines[device.device_id] = device.expiry
+        heappush(self.heap, (device.expiry, device.device_id))
+
+    def discard(self, device_id: str) -> None:
+        self.devices.pop(device_id, None)
+        self.deadlines.pop(device_id, None)
+
+    def pop_expired(self, now: datetime) -> list[Device]:
+        expired: list[Device] = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, device_id = heappop(self.heap)
+            if self.deadlines.get(device_id) != deadline:
+                continue  # discarded or rescheduled since
+
+            device = self.devices[device_id]
+            if device.status == DeviceStatus.DEAD:
+                self.discard(device_id)
+            elif device.expiry > now:
+                self.schedule(device)
+            else:
+                self.discard(device_id)
+                expired.append(device)
+        return expired
@@ -0,0 +1,81 @@
+import logging
+from asyncio import Event, TimeoutError, wait_for
+from collections import defaultdict
+from contextlib import suppress
+
+from odmantic import AIOEngine, Model, ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+PendingKey = tuple[type[Model], ObjectId]
+PendingEntry = tuple[Model, set[str]]
+
+
+def update_request(instance: Model, fields: set[str]) -> UpdateOne:
+    return UpdateOne(
+        instance.doc(include={instance.__primary_field__}),
+        {"$set": instance.doc(include=fields)},
+    )
+
+
+class StateFlusher:
+    """
+    Write-behind buffer for frequently updated documents
+
+    Repeated updates to the same document are coalesced into one ``$set``
+    with the latest values, all pending updates are sent as one ``bulk_write``
+    per collection once ``interval`` passes or ``threshold`` documents pile up.
+    Only assigned fields are written, so lists must be replaced, not mutated
+    """
+
+    def __init__(self, engine: AIOEngine, interval: float, threshold: int) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.threshold = threshold
+        self.pending: dict[PendingKey, PendingEntry] = {}
+        self.flush_requested: Event = Event()
+
+    def merge(self, instance: Model, fields: set[str]) -> None:
+        key = (type(instance), instance.id)
+        previous = self.pending.get(key)
+        if previous is not None:
+            fields = fields | previous[1]
+        self.pending[key] = instance, fields
+
+    def mark(self, instance: Model) -> None:
+        fields = instance.__fields_modified__
+        if not fields:
+            return
+        # odmantic models don't allow assigning their own attributes
+        object.__setattr__(instance, "__fields_modified__", set())  # noqa: WPS609
+        self.merge(instance, fields)
+        if len(self.pending) >= self.threshold:
+            self.flush_requested.set()
+
+    def take_batches(self) -> dict[type[Model], list[PendingEntry]]:
+        batches: dict[type[Model], list[PendingEntry]] = defaultdict(list)
+        for (model, _), entry in self.pending.items():
+            batches[model].append(entry)
+        self.pending = {}
+        self.flush_requested.clear()
+        return batches
+
+    async def write(self, model: type[Model], entries: list[PendingEntry]) -> None:
+        requests = [update_request(instance, fields) for instance, fields in entries]
+        try:
+            await self.engine.get_collection(model).bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            logging.error(f"Flush for {model.__name__} failed", exc_info=e)
+            for entry in entries:
+                self.merge(*entry)
+
+    async def flush(self) -> None:
+        for model, entries in self.take_batches().items():
+            await self.write(model, entries)
+
+    async def run(self) -> None:
+        while True:  # noqa: WPS457
+            with suppress(TimeoutError):
+                await wait_for(self.flush_requested.wait(), timeout=self.interval)
+            if self.pending:
+                await self.flush()
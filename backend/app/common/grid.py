@@ -0,0 +1,86 @@
+from bisect import bisect_left, bisect_right, insort
+
+from odmantic import AIOEngine, ObjectId
+
+from app.models.cells_db import Cell
+
+Position = tuple[int, int]
+
+
+class CellGrid:
+    """
+    In-memory spatial index of cell coordinates
+
+    Every row of the map keeps the sorted x of its cells and the rows are
+    sorted by y, so a rectangle query bisects straight to the cells inside
+    it and returns them in the same (y, x) order as the cell listing. Only
+    ids and coordinates are kept, which stays small for millions of cells
+    """
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.cells: dict[Position, ObjectId] = {}
+        self.positions: dict[ObjectId, Position] = {}
+        self.rows: dict[int, list[int]] = {}
+        self.row_keys: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    async def load_from(self, engine: AIOEngine) -> None:
+        self.clear()
+        cursor = engine.get_collection(Cell).find(
+            {}, {"x": 1, "y": 1}, sort=[("y", 1), ("x", 1)]
+        )
+        async for document in cursor:
+            self.add(document["_id"], document["x"], document["y"])
+
+    def add(self, cell_id: ObjectId, x: int, y: int) -> None:
+        previous = self.cells.get((x, y))
+        if previous is None:
+            self.insert(x, y)
+        else:
+            del self.positions[previous]
+        self.cells[x, y] = cell_id
+        self.positions[cell_id] = (x, y)
+
+    def insert(self, x: int, y: int) -> None:
+        row = self.rows.get(y)
+        if row is None:
+            self.rows[y] = [x]
+            insort(self.row_keys, y)
+        else:
+            insort(row, x)
+
+    def columns(self, y: int, min_x: int, max_x: int) -> list[int]:
+        row = self.rows[y]
+        return row[bisect_left(row, min_x) : bisect_right(row, max_x)]  # noqa: E203
+
+    def position(self, cell_id: ObjectId) -> Position | None:
+        return self.positions.get(cell_id)
+
+    def update(self, cell: Cell) -> None:
+        self.add(cell.id, cell.x, cell.y)
+
+    def area(self, min_x: int, max_x: int, min_y: int, max_y: int) -> list[Position]:
+        """Positions of cells inside the inclusive rectangle, sorted by (y, x)"""
+        found: list[Position] = []
+        first = bisect_left(self.row_keys, min_y)
+        last = bisect_right(self.row_keys, max_y)
+        for y in self.row_keys[first:last]:
+            found.extend((x, y) for x in self.columns(y, min_x, max_x))
+        return found
+
+    def neighbours(self, cell_id: ObjectId, radius: int = 1) -> list[ObjectId]:
+        """Cells within the Chebyshev distance, the cell itself excluded"""
+        position = self.positions.get(cell_id)
+        if position is None:
+            return []
+        x, y = position
+        return [
+            self.cells[near]
+            for near in self.area(x - radius, x + radius, y - radius, y + radius)
+            if near != position
+        ]
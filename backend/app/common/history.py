@@ -0,0 +1,165 @@
+import logging
+from asyncio import Event, TimeoutError, wait_for
+from contextlib import suppress
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+from odmantic import AIOEngine, Model, ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.models.telemetry_db import (
+    RollupResolution,
+    TelemetryBucket,
+    TelemetryKind,
+    TelemetryRollup,
+)
+
+BUCKET_SPAN: timedelta = timedelta(hours=1)
+ROLLUP_SPANS: MappingProxyType[RollupResolution, timedelta] = MappingProxyType(
+    {
+        RollupResolution.MINUTE: timedelta(minutes=1),
+        RollupResolution.HOUR: timedelta(hours=1),
+    }
+)
+
+SampleKey = tuple[str, TelemetryKind, datetime]
+RollupKey = tuple[ObjectId, TelemetryKind, RollupResolution, datetime]
+Samples = list[tuple[datetime, float]]
+CellSamples = tuple[ObjectId, Samples]
+
+
+def truncate(at: datetime, span: timedelta) -> datetime:
+    return datetime.min + (at - datetime.min) // span * span
+
+
+def bucket_update(cell_id: ObjectId, samples: Samples) -> dict[str, object]:
+    return {
+        "$setOnInsert": {"cell_id": cell_id},
+        "$push": {
+            "samples": {"$each": [{"at": at, "value": value} for at, value in samples]}
+        },
+        "$inc": {"count": len(samples), "total": sum(value for _, value in samples)},
+    }
+
+
+class Aggregate:
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self, value: float) -> None:
+        self.count: int = 1
+        self.total: float = value
+        self.minimum: float = value
+        self.maximum: float = value
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+
+class TelemetryHistory:
+    """
+    Batched ingest of telemetry history
+
+    Raw samples are appended to one document per device-hour, minute and
+    hour rollups per cell are pre-aggregated in memory. Both are written
+    with one upserting bulk_write per collection per flush, so history adds
+    no database writes to the MQTT handlers themselves
+    """
+
+    def __init__(self, engine: AIOEngine, interval: float, threshold: int) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.threshold = threshold
+        self._samples: dict[SampleKey, CellSamples] = {}
+        self._rollups: dict[RollupKey, Aggregate] = {}
+        self.pending: int = 0
+        self.flush_requested: Event = Event()
+
+    def record(  # noqa: WPS211
+        self,
+        device_id: str,
+        cell_id: ObjectId,
+        kind: TelemetryKind,
+        value: float,
+        at: datetime | None = None,
+    ) -> None:
+        at = at or datetime.utcnow()
+
+        sample_key = (device_id, kind, truncate(at, BUCKET_SPAN))
+        self._samples.setdefault(sample_key, (cell_id, []))[1].append((at, value))
+
+        self.add_rollups(cell_id, kind, value, at)
+        self.pending += 1
+        if self.pending >= self.threshold:
+            self.flush_requested.set()
+
+    def add_rollups(
+        self, cell_id: ObjectId, kind: TelemetryKind, value: float, at: datetime
+    ) -> None:
+        for resolution, span in ROLLUP_SPANS.items():
+            rollup_key = (cell_id, kind, resolution, truncate(at, span))
+            aggregate = self._rollups.get(rollup_key)
+            if aggregate is None:
+                self._rollups[rollup_key] = Aggregate(value)
+            else:
+                aggregate.add(value)
+
+    def sample_requests(self) -> list[UpdateOne]:
+        return [
+            UpdateOne(
+                {"device_id": device_id, "kind": kind.value, "start": start},
+                bucket_update(cell_id, samples),
+                upsert=True,
+            )
+            for (device_id, kind, start), (cell_id, samples) in self._samples.items()
+        ]
+
+    def rollup_requests(self) -> list[UpdateOne]:
+        return [
+            UpdateOne(
+                {
+                    "cell_id": cell_id,
+                    "kind": kind.value,
+                    "resolution": resolution.value,
+                    "start": start,
+                },
+                {
+                    "$inc": {"count": aggregate.count, "total": aggregate.total},
+                    "$min": {"minimum": aggregate.minimum},
+                    "$max": {"maximum": aggregate.maximum},
+                },
+                upsert=True,
+            )
+            for (cell_id, kind, resolution, start), aggregate in self._rollups.items()
+        ]
+
+    async def flush(self) -> None:
+        batches: dict[type[Model], list[UpdateOne]] = {
+            TelemetryBucket: self.sample_requests(),
+            TelemetryRollup: self.rollup_requests(),
+        }
+        self._samples = {}
+        self._rollups = {}
+        self.pending = 0
+        self.flush_requested.clear()
+
+        for model, requests in batches.items():
+            if not requests:
+                continue
+            try:
+                await self.engine.get_collection(model).bulk_write(
+                    requests, ordered=False
+                )
+            except PyMongoError as e:
+                # not retried: a partially applied $push/$inc can't be repeated
+                logging.error(f"History flush for {model.__name__} failed", exc_info=e)
+
+    async def run(self) -> None:
+        while True:  # noqa: WPS457
+            with suppress(TimeoutError):
+                await wait_for(self.flush_requested.wait(), timeout=self.interval)
+            if self.pending != 0:
+                await self.flush()
@@ -0,0 +1,61 @@
+import logging
+from typing import Any
+
+from odmantic import AIOEngine, Model
+from odmantic.index import ODMBaseIndex
+from pymongo.errors import OperationFailure
+
+DUPLICATE_KEY = 11000
+
+
+def describe_group(group: dict[str, Any]) -> str:
+    keys = ", ".join(map(str, group["_id"].values()))
+    ids = ", ".join(map(str, group["ids"]))
+    return f"({keys}): {ids}"
+
+
+async def find_duplicates(
+    engine: AIOEngine, model: type[Model], fields: tuple[str, ...]
+) -> list[str]:
+    cursor = engine.get_collection(model).aggregate(
+        [
+            {
+                "$group": {
+                    "_id": {field: f"${field}" for field in fields},
+                    "ids": {"$push": "$_id"},
+                }
+            },
+            {"$match": {"ids.1": {"$exists": True}}},
+        ]
+    )
+    return [describe_group(group) for group in await cursor.to_list(None)]
+
+
+async def create_non_unique(engine: AIOEngine, model: type[Model]) -> None:
+    """configure_database stops at the failed unique index, creates the rest"""
+    collection = engine.get_collection(model)
+    for index in model.__indexes__():
+        if isinstance(index, ODMBaseIndex):
+            index = index.get_pymongo_index()
+        if not index.document.get("unique"):
+            await collection.create_indexes([index])
+
+
+async def configure_unique(
+    engine: AIOEngine, model: type[Model], fields: tuple[str, ...]
+) -> None:
+    """
+    Creates the indexes of a model, documents created before ``fields`` were
+    unique may share them, the hub then starts without the unique index and
+    new documents are not checked for duplicates until they are resolved
+    """
+    try:
+        await engine.configure_database([model], update_existing_indexes=True)
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+        await create_non_unique(engine, model)
+        name = model.__name__
+        keys = ", ".join(fields)
+        duplicates = "; ".join(await find_duplicates(engine, model, fields))
+        logging.error(f"{name} {keys} not unique, resolve and restart: {duplicates}")
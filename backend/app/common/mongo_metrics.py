@@ -0,0 +1,85 @@
+from datetime import timedelta
+from threading import Lock
+from time import monotonic
+
+from odmantic import AIOEngine
+from pymongo.monitoring import (
+    CommandFailedEvent,
+    CommandListener,
+    CommandStartedEvent,
+    CommandSucceededEvent,
+)
+
+from app.models.devices_db import Device, DeviceStatus
+from common.metrics import Histogram
+
+CommandKey = tuple[str, str]
+
+
+class MongoMetrics(CommandListener):
+    """
+    Counts and times MongoDB commands per collection and command name
+
+    Motor runs pymongo in worker threads, so events are recorded under a lock
+    """
+
+    def __init__(self) -> None:
+        self.lock: Lock = Lock()
+        self.running: dict[int, CommandKey] = {}
+        self.latency: dict[CommandKey, Histogram] = {}
+        self.failures: dict[CommandKey, int] = {}
+
+    def started(self, event: CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""  # admin and cursor commands
+        with self.lock:
+            self.running[event.request_id] = (collection, event.command_name)
+
+    def finish(self, request_id: int, duration_micros: int, failed: bool) -> None:
+        with self.lock:
+            key = self.running.pop(request_id, None)
+            if key is None:
+                return
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = Histogram()
+                self.latency[key] = histogram
+            histogram.observe(timedelta(microseconds=duration_micros).total_seconds())
+            if failed:
+                self.failures[key] = self.failures.get(key, 0) + 1
+
+    def succeeded(self, event: CommandSucceededEvent) -> None:
+        self.finish(event.request_id, event.duration_micros, failed=False)
+
+    def failed(self, event: CommandFailedEvent) -> None:
+        self.finish(event.request_id, event.duration_micros, failed=True)
+
+
+class DeviceCounts:
+    """
+    Devices in the database by status
+
+    Counting groups the whole collection, so the result is kept for a few
+    scrape intervals instead of being taken on every scrape
+    """
+
+    def __init__(self, engine: AIOEngine, ttl: float) -> None:
+        self.engine = engine
+        self.ttl = ttl
+        self.counts: dict[str, int] = {}
+        self.counted_at: float | None = None
+
+    async def get(self) -> dict[str, int]:
+        now = monotonic()
+        if self.counted_at is not None and now - self.counted_at < self.ttl:
+            return self.counts
+        counts = {status.value: 0 for status in DeviceStatus}
+        cursor = self.engine.get_collection(Device).aggregate(
+            [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        )
+        for group in await cursor.to_list(None):
+            counts[group["_id"]] = group["count"]
+        self.counts = counts
+        self.counted_at = now
+        return counts
@@ -0,0 +1,57 @@
+import logging
+from asyncio import Event, TimeoutError, wait_for
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+
+from common.types import DeviceInfo
+
+PairingHandler = Callable[[list[DeviceInfo], list[str]], Awaitable[None]]
+
+
+class PairingQueue:
+    """
+    Batches pairing messages, so a scan answered by the whole fleet costs
+    a few bulk writes instead of a read and a write per device
+
+    Ready and confirm messages are deduplicated by device id and handed over
+    together once ``interval`` passes or ``threshold`` devices pile up
+    """
+
+    def __init__(self, interval: float, threshold: int) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.ready: dict[str, DeviceInfo] = {}
+        self.confirmed: dict[str, None] = {}
+        self.flush_requested: Event = Event()
+
+    def __len__(self) -> int:
+        return len(self.ready) + len(self.confirmed)
+
+    def add_ready(self, device_info: DeviceInfo) -> None:
+        self.ready[device_info.id] = device_info
+        if len(self) >= self.threshold:
+            self.flush_requested.set()
+
+    def add_confirm(self, device_id: str) -> None:
+        self.confirmed[device_id] = None
+        if len(self) >= self.threshold:
+            self.flush_requested.set()
+
+    def take(self) -> tuple[list[DeviceInfo], list[str]]:
+        ready = list(self.ready.values())
+        confirmed = list(self.confirmed)
+        self.ready = {}
+        self.confirmed = {}
+        return ready, confirmed
+
+    async def run(self, handler: PairingHandler) -> None:
+        while True:  # noqa: WPS457
+            with suppress(TimeoutError):
+                await wait_for(self.flush_requested.wait(), timeout=self.interval)
+            self.flush_requested.clear()
+            if not self:
+                continue
+            try:
+                await handler(*self.take())
+            except Exception as e:
+                logging.error("Pairing batch failed", exc_info=e)
@@ -0,0 +1,80 @@
+import logging
+import sys
+from asyncio import get_running_loop, sleep
+from collections import Counter
+from pathlib import Path
+from threading import Event, Thread, get_ident
+from types import FrameType
+
+
+def collapse(frame: FrameType | None) -> str:
+    names: list[str] = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop thread from a helper thread
+
+    Produces the collapsed stack format read by flamegraph.pl and speedscope,
+    one ``frame;frame;frame count`` line per distinct stack
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.thread: Thread | None = None
+        self.stopped: Event = Event()
+        self.stacks: Counter[str] = Counter()
+
+    @property
+    def is_running(self) -> bool:
+        return self.thread is not None
+
+    def sample(self, thread_id: int) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)  # noqa: WPS437
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def start(self) -> None:
+        if self.thread is not None:
+            raise RuntimeError("Profiler is already running")
+        self.stacks = Counter()
+        self.stopped.clear()
+        self.thread = Thread(target=self.sample, args=(get_ident(),), daemon=True)
+        self.thread.start()
+
+    def stop(self) -> str:
+        if self.thread is None:
+            raise RuntimeError("Profiler is not running")
+        self.stopped.set()
+        self.thread.join()
+        self.thread = None
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    async def profile(self, seconds: float) -> str:
+        self.start()
+        try:
+            await sleep(seconds)
+        finally:
+            dump = self.stop()
+        return dump
+
+    async def dump(self, seconds: float, path: Path) -> None:
+        path.write_text(await self.profile(seconds))
+        logging.info(f"Profile of {seconds}s written to {path}")
+
+
+async def watch_loop_lag(threshold: float, interval: float = 0.1) -> None:
+    """Logs whenever a callback keeps the event loop busy beyond the threshold"""
+    loop = get_running_loop()
+    while True:  # noqa: WPS457
+        expected = loop.time() + interval
+        await sleep(interval)
+        lag = loop.time() - expected
+        if lag > threshold:
+            logging.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
@@ -0,0 +1,81 @@
+from collections import Counter
+from collections.abc import Callable
+
+from odmantic import AIOEngine, ObjectId, query
+
+from app.models.cells_db import Cell
+from app.models.devices_db import Device, DeviceStatus
+
+
+async def find_owned(engine: AIOEngine, owns: Callable[[str], bool]) -> list[Device]:
+    paired = await engine.find(Device, Device.status == DeviceStatus.PAIRED)
+    return [device for device in paired if owns(device.device_id)]
+
+
+class DeviceRegistry:
+    """
+    Process-local write-through cache of paired devices and their cells
+
+    Every code path that changes pairing state has to update the registry
+    right after saving, the telemetry hot path then relies on it exclusively
+    """
+
+    def __init__(self) -> None:
+        self.devices: dict[str, Device] = {}
+        self.cells: dict[ObjectId, Cell] = {}
+        self.cell_references: Counter[ObjectId] = Counter()
+
+    async def load_from(self, engine: AIOEngine, owns: Callable[[str], bool]) -> None:
+        """Replaces the contents at once, so lookups keep working while loading"""
+        loaded = DeviceRegistry()
+        devices = await find_owned(engine, owns)
+        cell_ids = [device.cell_id for device in devices if device.cell_id is not None]
+        for cell in await engine.find(Cell, query.in_(Cell.id, cell_ids)):
+            loaded.cells[cell.id] = cell
+        for device in devices:
+            loaded.add(device)
+
+        self.devices = loaded.devices
+        self.cells = loaded.cells
+        self.cell_references = loaded.cell_references
+
+    def get(self, device_id: str) -> Device | None:
+        return self.devices.get(device_id)
+
+    def get_cell(self, cell_id: ObjectId | None) -> Cell | None:
+        if cell_id is None:
+            return None
+        return self.cells.get(cell_id)
+
+    def refresh_cell(self, cell: Cell, fields: set[str]) -> None:
+        """
+        Copies fields saved elsewhere from a fresh copy into the cached cell,
+        they aren't marked as modified so they aren't written back
+        """
+        cached = self.cells.get(cell.id)
+        if cached is None:
+            return
+        for name in fields:
+            setattr(cached, name, getattr(cell, name))
+        unsaved = cached.__fields_modified__ - fields
+        object.__setattr__(cached, "__fields_modified__", unsaved)  # noqa: WPS609
+
+    def add(self, device: Device, cell: Cell | None = None) -> None:
+        self.remove(device.device_id)
+        self.devices[device.device_id] = device
+        if device.cell_id is None:
+            return
+        if cell is not None:
+            # the cached instance (if any) is the source of truth
+            self.cells.setdefault(device.cell_id, cell)
+        self.cell_references[device.cell_id] += 1
+
+    def remove(self, device_id: str) -> Device | None:
+        device = self.devices.pop(device_id, None)
+        if device is None or device.cell_id is None:
+            return device
+        self.cell_references[device.cell_id] -= 1
+        if self.cell_references[device.cell_id] <= 0:
+            del self.cell_references[device.cell_id]
+            self.cells.pop(device.cell_id, None)
+        return device
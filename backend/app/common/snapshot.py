@@ -0,0 +1,130 @@
+import logging
+from collections.abc import Callable
+from pathlib import Path
+from time import monotonic
+from typing import Any
+from uuid import uuid4
+
+from bson import json_util
+from odmantic import ObjectId
+
+from app.common.registry import DeviceRegistry
+from app.models.cells_db import Cell
+from app.models.devices_db import Device
+
+Snapshot = tuple[dict[ObjectId, Cell], list[Device]]
+
+
+def load_hub_id_from(path: Path) -> str:
+    """Reads the hub id kept from previous runs, creating it on the first one"""
+    if path.exists():
+        hub_id = path.read_text().strip()
+        if hub_id != "":
+            return hub_id
+    hub_id = uuid4().hex
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(hub_id)
+    return hub_id
+
+
+class HubIdentity:
+    """
+    Id devices are paired with
+
+    Taken from the configuration when set, otherwise loaded on startup from
+    the data directory, so importing the config doesn't create any files
+    """
+
+    def __init__(self, configured: str | None, path: Path) -> None:
+        self.path = path
+        self.loaded: str | None = configured
+
+    @property
+    def id(self) -> str:
+        if self.loaded is None:
+            raise RuntimeError("Hub id is used before it is loaded")
+        return self.loaded
+
+    def load_from_file(self) -> str:
+        if self.loaded is None:
+            self.loaded = load_hub_id_from(self.path)
+        return self.loaded
+
+
+def parse_snapshot(text: str, hub_id: str) -> Snapshot | None:
+    """Snapshots saved by another hub are ignored"""
+    snapshot: dict[str, Any] = json_util.loads(text)
+    if snapshot.get("hub_id") != hub_id:
+        return None
+    cells = {cell.id: cell for cell in map(Cell.parse_doc, snapshot["cells"])}
+    return cells, [Device.parse_doc(doc) for doc in snapshot["devices"]]
+
+
+def add_owned(
+    registry: DeviceRegistry, snapshot: Snapshot, owns: Callable[[str], bool]
+) -> None:
+    cells, devices = snapshot
+    for device in devices:
+        if owns(device.device_id):
+            cell = None if device.cell_id is None else cells.get(device.cell_id)
+            registry.add(device, cell)
+
+
+class WarmStart:
+    """
+    Local snapshot of the registry for restarts
+
+    The snapshot saved on shutdown lets the next run subscribe to paired
+    devices before the database is read, the registry is then reloaded from
+    the database in the background. Time from start to the first telemetry
+    message is measured to compare cold and warm starts
+    """
+
+    def __init__(self, path: Path, hub: HubIdentity) -> None:
+        self.path = path
+        self.hub = hub
+        self.started_at: float = monotonic()
+        self.restored: int | None = None
+        self.first_telemetry: float | None = None
+
+    def save_to_file(self, registry: DeviceRegistry) -> None:
+        snapshot = {
+            "hub_id": self.hub.id,
+            "devices": [device.doc() for device in registry.devices.values()],
+            "cells": [cell.doc() for cell in registry.cells.values()],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json_util.dumps(snapshot))
+        logging.info(f"Registry snapshot saved: {len(registry.devices)} devices")
+
+    def restore(
+        self, registry: DeviceRegistry, owns: Callable[[str], bool]
+    ) -> int | None:
+        """Returns the number of devices restored or None if there's no snapshot"""
+        if not self.path.exists():
+            return None
+        try:
+            snapshot = parse_snapshot(self.path.read_text(), self.hub.id)
+        except (ValueError, KeyError) as e:
+            logging.warning("Registry snapshot is unreadable, ignoring", exc_info=e)
+            return None
+        if snapshot is None:
+            return None
+
+        add_owned(registry, snapshot, owns)
+        self.restored = len(registry.devices)
+        logging.info(f"Registry restored from the snapshot: {self.restored} devices")
+        return self.restored
+
+    def telemetry_received(self) -> None:
+        if self.first_telemetry is not None:
+            return
+        self.first_telemetry = monotonic() - self.started_at
+        start = "cold" if self.restored is None else "warm"
+        logging.info(f"First telemetry {self.first_telemetry:.3f}s after {start} start")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "restored": self.restored,
+            "first_telemetry": self.first_telemetry,
+        }
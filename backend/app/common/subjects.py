@@ -0,0 +1,311 @@
+import logging
+from asyncio import Event, TimeoutError, wait_for
+from collections.abc import Iterable
+from contextlib import suppress
+from datetime import datetime, timedelta
+
+from odmantic import AIOEngine, Model, ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.common.history import BUCKET_SPAN, truncate
+from app.models.cells_db import Subject
+from app.models.subjects_db import SubjectLocation, SubjectTrack
+from common.codecs import SubjectTuple
+
+TrackKey = tuple[int, datetime]
+PendingPoint = tuple[datetime, ObjectId, int, int]  # at, cell_id, x, y
+
+
+def subject_models(
+    subjects: list[SubjectTuple], previous: list[Subject] | None
+) -> list[Subject]:
+    """Validates subjects of a changed frame, reusing models that didn't move"""
+    known = {(s.x, s.y, s.subject_id): s for s in previous or []}
+    return [
+        known.get((x, y, subject_id)) or Subject(x=x, y=y, subject_id=subject_id)
+        for x, y, subject_id in subjects
+    ]
+
+
+class Sighting:
+    __slots__ = ("cell_id", "x", "y", "last_seen", "written")
+
+    def __init__(self, cell_id: ObjectId, x: int, y: int, at: datetime) -> None:
+        self.cell_id: ObjectId = cell_id
+        self.x: int = x
+        self.y: int = y
+        self.last_seen: datetime = at
+        self.written: datetime | None = None
+
+    def is_at(self, cell_id: ObjectId, x: int, y: int) -> bool:
+        return self.cell_id == cell_id and self.x == x and self.y == y
+
+    def is_written(self) -> bool:
+        return self.written is not None and self.written >= self.last_seen
+
+    def move(self, cell_id: ObjectId, x: int, y: int) -> None:
+        self.cell_id = cell_id
+        self.x = x
+        self.y = y
+
+
+class Frame:
+    """Subjects of the last camera frame of a cell"""
+
+    __slots__ = ("subjects", "digest", "seen", "touched")
+
+    def __init__(
+        self, subjects: dict[int, tuple[int, int]], digest: bytes | None, at: datetime
+    ) -> None:
+        self.subjects = subjects
+        self.digest = digest
+        self.seen: datetime = at
+        self.touched: datetime = at
+
+
+def frame_positions(subjects: Iterable[SubjectTuple]) -> dict[int, tuple[int, int]]:
+    return {subject_id: (x, y) for x, y, subject_id in subjects}
+
+
+def track_points(points: list[PendingPoint]) -> list[dict[str, object]]:
+    return [
+        {"at": at, "cell_id": cell_id, "x": x, "y": y} for at, cell_id, x, y in points
+    ]
+
+
+class SubjectTracker:
+    """
+    Index of where every subject was last seen, built from camera frames
+
+    Each frame is diffed with the previous frame of the same cell. Subjects
+    that appeared or moved get their location upserted and a trajectory
+    point pushed to a per subject-hour document, subjects standing still
+    only refresh ``last_seen`` once per ``precision``. Writes are batched
+    into one ``bulk_write`` per collection like the telemetry history.
+    A repeated frame, recognized by the digest of its payload, costs the
+    same no matter how many subjects it has. Frames of cameras that stopped
+    sending and subjects missing from every frame are forgotten once they
+    are older than ``precision`` and written
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        engine: AIOEngine,
+        interval: float,
+        threshold: int,
+        precision: float,
+        shared: bool,
+    ) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.threshold = threshold
+        self.precision = timedelta(seconds=precision)
+        # locations written by other cluster workers are only in the database
+        self.shared = shared
+        self.flush_requested: Event = Event()
+        self._sightings: dict[int, Sighting] = {}
+        self._frames: dict[ObjectId, Frame] = {}
+        self._dirty: set[int] = set()
+        self._points: dict[TrackKey, list[PendingPoint]] = {}
+        self._evicted: datetime = datetime.utcnow()
+
+    def see(  # noqa: WPS211
+        self, cell_id: ObjectId, subject_id: int, x: int, y: int, at: datetime
+    ) -> None:
+        sighting = self._sightings.get(subject_id)
+        if sighting is None:
+            sighting = Sighting(cell_id, x, y, at)
+            self._sightings[subject_id] = sighting
+        elif sighting.is_at(cell_id, x, y):
+            sighting.last_seen = at
+            if sighting.written is None or at - sighting.written >= self.precision:
+                self._dirty.add(subject_id)
+            return
+        else:
+            sighting.move(cell_id, x, y)
+        sighting.last_seen = at
+        self._dirty.add(subject_id)
+        track_key = (subject_id, truncate(at, BUCKET_SPAN))
+        self._points.setdefault(track_key, []).append((at, cell_id, x, y))
+
+    def see_frame(self, cell_id: ObjectId, frame: Frame) -> None:
+        for subject_id, (x, y) in frame.subjects.items():
+            self.see(cell_id, subject_id, x, y, frame.seen)
+
+    def has_changed(
+        self,
+        cell_id: ObjectId,
+        subjects: Iterable[SubjectTuple],
+        at: datetime | None = None,
+        digest: bytes | None = None,
+    ) -> bool:
+        """
+        Observes a camera frame, returns whether it differs from the previous one
+
+        ``digest`` of the raw payload lets ``is_repeat`` recognize the same
+        frame without decoding it again
+        """
+        at = at or datetime.utcnow()
+        positions = frame_positions(subjects)
+        previous = self._frames.get(cell_id)
+        self._frames[cell_id] = Frame(positions, digest, at)
+        self.see_frame(cell_id, self._frames[cell_id])
+        if len(self._dirty) >= self.threshold:
+            self.flush_requested.set()
+        return previous is None or positions != previous.subjects
+
+    def is_repeat(
+        self, cell_id: ObjectId, digest: bytes, at: datetime | None = None
+    ) -> bool:
+        """Observes the previous frame again if the payload digest matches it"""
+        frame = self._frames.get(cell_id)
+        if frame is None or digest != frame.digest:
+            return False
+        frame.seen = at or datetime.utcnow()
+        if frame.seen - frame.touched >= self.precision:
+            frame.touched = frame.seen
+            self.see_frame(cell_id, frame)
+        return True
+
+    def last_seen(self, subject_id: int, sighting: Sighting) -> datetime:
+        """Counts repeated frames that weren't walked subject by subject"""
+        frame = self._frames.get(sighting.cell_id)
+        if frame is None or frame.subjects.get(subject_id) != (sighting.x, sighting.y):
+            return sighting.last_seen
+        return max(sighting.last_seen, frame.seen)
+
+    def location(self, subject_id: int, sighting: Sighting) -> SubjectLocation:
+        return SubjectLocation(
+            subject_id=subject_id,
+            cell_id=sighting.cell_id,
+            x=sighting.x,
+            y=sighting.y,
+            last_seen=self.last_seen(subject_id, sighting),
+        )
+
+    async def locate(self, subject_id: int) -> SubjectLocation | None:
+        sighting = self._sightings.get(subject_id)
+        if sighting is not None and not self.shared:
+            return self.location(subject_id, sighting)
+        stored = await self.engine.find_one(
+            SubjectLocation, SubjectLocation.subject_id == subject_id
+        )
+        if sighting is None:
+            return stored
+        location = self.location(subject_id, sighting)
+        if stored is None or stored.last_seen < location.last_seen:
+            return location
+        return stored
+
+    def drop_frame(self, cell_id: ObjectId) -> None:
+        """Forgets a frame, repeats of it that weren't walked go to the sightings"""
+        frame = self._frames.pop(cell_id)
+        for subject_id, (x, y) in frame.subjects.items():
+            sighting = self._sightings.get(subject_id)
+            if sighting is None or not sighting.is_at(cell_id, x, y):
+                continue
+            if sighting.last_seen < frame.seen:
+                sighting.last_seen = frame.seen
+                self._dirty.add(subject_id)
+
+    def is_gone(self, subject_id: int, sighting: Sighting, now: datetime) -> bool:
+        """Whether the subject is missing from every frame for ``precision``"""
+        frame = self._frames.get(sighting.cell_id)
+        if frame is not None and subject_id in frame.subjects:
+            return False
+        return now - sighting.last_seen > self.precision
+
+    def evict_frames(self, now: datetime) -> None:
+        stale = [
+            cell_id
+            for cell_id, frame in self._frames.items()
+            if now - frame.seen > self.precision
+        ]
+        for stale_cell in stale:
+            self.drop_frame(stale_cell)
+
+    def evict(self, now: datetime) -> None:
+        """
+        Forgets frames and subjects that weren't seen for ``precision``
+
+        A gone subject whose last sighting isn't written yet is flushed first
+        and forgotten on the next eviction
+        """
+        self._evicted = now
+        self.evict_frames(now)
+        gone = [
+            subject_id
+            for subject_id, sighting in self._sightings.items()
+            if subject_id not in self._dirty and self.is_gone(subject_id, sighting, now)
+        ]
+        for gone_subject in gone:
+            if self._sightings[gone_subject].is_written():
+                del self._sightings[gone_subject]
+            else:
+                self._dirty.add(gone_subject)
+
+    def location_requests(self, subject_ids: set[int]) -> list[UpdateOne]:
+        requests: list[UpdateOne] = []
+        for subject_id in subject_ids:
+            sighting = self._sightings[subject_id]
+            sighting.last_seen = self.last_seen(subject_id, sighting)
+            sighting.written = sighting.last_seen
+            requests.append(
+                UpdateOne(
+                    {"subject_id": subject_id},
+                    {
+                        "$set": {
+                            "cell_id": sighting.cell_id,
+                            "x": sighting.x,
+                            "y": sighting.y,
+                            "last_seen": sighting.last_seen,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+        return requests
+
+    def track_requests(self) -> list[UpdateOne]:
+        return [
+            UpdateOne(
+                {"subject_id": subject_id, "start": start},
+                {"$push": {"points": {"$each": track_points(points)}}},
+                upsert=True,
+            )
+            for (subject_id, start), points in self._points.items()
+        ]
+
+    async def flush(self) -> None:
+        dirty = self._dirty
+        batches: dict[type[Model], list[UpdateOne]] = {
+            SubjectLocation: self.location_requests(dirty),
+            SubjectTrack: self.track_requests(),
+        }
+        self._dirty = set()
+        self._points = {}
+        self.flush_requested.clear()
+
+        for model, requests in batches.items():
+            if not requests:
+                continue
+            try:
+                await self.engine.get_collection(model).bulk_write(
+                    requests, ordered=False
+                )
+            except PyMongoError as e:
+                logging.error(f"Subject flush for {model.__name__} failed", exc_info=e)
+                # upserts of the latest state repeat safely, pushes don't
+                if model is SubjectLocation:
+                    self._dirty |= dirty
+
+    async def run(self) -> None:
+        while True:  # noqa: WPS457
+            with suppress(TimeoutError):
+                await wait_for(self.flush_requested.wait(), timeout=self.interval)
+            if self._dirty:
+                await self.flush()
+            now = datetime.utcnow()
+            if now - self._evicted >= self.precision:
+                self.evict(now)
@@ -0,0 +1,50 @@
+from collections.abc import Sequence
+from enum import Enum
+
+from app.models.devices_db import Device
+from common.mqtt_service import MQTTService
+
+
+class SubscriptionMode(str, Enum):
+    DEVICE = "device"
+    WILDCARD = "wildcard"
+
+
+class DeviceSubscriptions:
+    """
+    Broker subscriptions for device telemetry
+
+    In the device mode every paired device is subscribed to separately.
+    In the wildcard mode the hub subscribes once per device type and filters
+    unknown devices in-process, so pairing causes no subscription churn
+    """
+
+    def __init__(
+        self,
+        mqtt_service: MQTTService,
+        mode: SubscriptionMode,
+        batch_size: int = 500,
+    ) -> None:
+        self.mqtt_service = mqtt_service
+        self.mode = mode
+        self.batch_size = batch_size
+
+    @property
+    def is_wildcard(self) -> bool:
+        return self.mode == SubscriptionMode.WILDCARD
+
+    async def subscribe(self, devices: Sequence[Device]) -> None:
+        client = self.mqtt_service.client
+        if client is None or self.is_wildcard:
+            return
+        topics = [(device.device_topic, 0) for device in devices]
+        for start in range(0, len(topics), self.batch_size):
+            await client.subscribe(
+                topics[start : start + self.batch_size]  # noqa: E203
+            )
+
+    async def unsubscribe(self, device: Device) -> None:
+        client = self.mqtt_service.client
+        if client is None or self.is_wildcard:
+            return
+        await client.unsubscribe(device.device_topic)
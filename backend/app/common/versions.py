@@ -0,0 +1,47 @@
+from collections import Counter
+from uuid import uuid4
+
+from fastapi import HTTPException
+from odmantic import Model
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+
+class CollectionVersions:
+    """
+    In-process change counters per model, used to build listing ETags
+
+    The epoch is random per process, so a restart invalidates all ETags and
+    workers of a cluster never share them. With ``relay`` bumps are also
+    collected for the other workers, which apply them to their own counters
+    """
+
+    def __init__(self, relay: bool = False) -> None:
+        self.epoch: str = uuid4().hex[:8]
+        self.versions: Counter[str] = Counter()
+        self.relay = relay
+        self.outgoing: set[str] = set()
+
+    def bump(self, model: type[Model]) -> None:
+        self.versions[model.__name__] += 1
+        if self.relay:
+            self.outgoing.add(model.__name__)
+
+    def apply(self, model_names: list[str]) -> None:
+        """Takes bumps relayed by another worker"""
+        for model_name in model_names:
+            self.versions[model_name] += 1
+
+    def drain(self) -> list[str]:
+        outgoing = sorted(self.outgoing)
+        self.outgoing = set()
+        return outgoing
+
+    def etag(self, model: type[Model]) -> str:
+        return f'W/"{self.epoch}-{self.versions[model.__name__]}"'
+
+    def check(self, model: type[Model], if_none_match: str | None) -> str:
+        """Returns the current ETag or raises 304 if the client has it already"""
+        etag = self.etag(model)
+        if if_none_match is not None and etag in if_none_match.split(", "):
+            raise HTTPException(HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return etag
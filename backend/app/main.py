@@ -1,42 +1,155 @@
 import logging
-from asyncio import CancelledError, get_event_loop
-from collections.abc import AsyncIterator
+from asyncio import AbstractEventLoop, CancelledError, Task, get_event_loop
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager, suppress
+from time import perf_counter
+from typing import Any
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from starlette.middleware.cors import CORSMiddleware
 
-from app.common.config import engine, mqtt_host, mqtt_service
+from app.common.config import (
+    climate,
+    cluster,
+    data_directory,
+    engine,
+    expiry_scheduler,
+    flusher,
+    grid,
+    history,
+    hub,
+    mqtt_host,
+    mqtt_service,
+    pairing,
+    profile_startup,
+    profiler,
+    registry,
+    slow_threshold,
+    subject_tracker,
+    subscriptions,
+    warm_start,
+)
+from app.common.indexes import configure_unique
+from app.common.profiler import watch_loop_lag
 from app.models.cells_db import Cell
 from app.models.devices_db import Device
-from app.routes import cells_mub, cells_rst, devices_mqt, devices_rst
+from app.models.subjects_db import SubjectLocation, SubjectTrack
+from app.models.telemetry_db import TelemetryBucket, TelemetryRollup
+from app.models.workers_db import HubWorker
+from app.routes import (
+    cells_mub,
+    cells_rst,
+    cluster_mqt,
+    devices_mqt,
+    devices_rst,
+    history_rst,
+    metrics_rst,
+    subjects_rst,
+)
 
 logging.basicConfig(level=logging.INFO)
 
 
-@asynccontextmanager
-async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+def start_diagnostics(loop: AbstractEventLoop) -> list[Task[Any]]:
+    tasks = []
+    if profile_startup > 0:
+        profile_path = data_directory / "profile.folded"
+        tasks.append(loop.create_task(profiler.dump(profile_startup, profile_path)))
+    if slow_threshold > 0:
+        tasks.append(loop.create_task(watch_loop_lag(slow_threshold)))
+    return tasks
+
+
+async def read_database() -> None:
     await engine.configure_database(
-        [Cell, Device],  # type: ignore
+        [  # type: ignore
+            HubWorker,
+            SubjectLocation,
+            SubjectTrack,
+            TelemetryBucket,
+            TelemetryRollup,
+        ],
         update_existing_indexes=True,
     )
+    await configure_unique(engine, Cell, ("x", "y"))
+    await configure_unique(engine, Device, ("device_id",))
+    await grid.load_from(engine)
+    await registry.load_from(engine, cluster.is_owned)
+    await expiry_scheduler.load_from(engine, registry.devices, cluster.is_owned)
 
-    loop = get_event_loop()
+
+async def resubscribe(restored: dict[str, Device]) -> None:
+    """Catches the subscriptions of snapshot devices up with the database"""
+    # devices unpaired or moved to another worker since the snapshot
+    for gone_id in restored.keys() - registry.devices.keys():
+        await subscriptions.unsubscribe(restored[gone_id])
+    await subscriptions.subscribe(
+        [
+            device
+            for device_id, device in registry.devices.items()
+            if device_id not in restored
+        ]
+    )
+
+
+def start_workers(loop: AbstractEventLoop) -> list[Task[Any]]:
     tasks = [
-        loop.create_task(mqtt_service.run_durable(mqtt_host=mqtt_host)),
         loop.create_task(devices_mqt.expiry_cleaner()),
-        loop.create_task(devices_mqt.reconnect_devices()),
+        loop.create_task(flusher.run()),
+        loop.create_task(history.run()),
+        loop.create_task(subject_tracker.run()),
+        loop.create_task(climate.run()),
+        loop.create_task(cluster.run()),
+        loop.create_task(pairing.run(devices_rst.process_pairing)),
     ]
+    if cluster.enabled:
+        tasks.append(loop.create_task(cluster_mqt.relay_changes()))
+    return tasks
 
-    yield
 
+async def shutdown(tasks: list[Task[Any]]) -> None:
     for task in tasks:
         task.cancel()
         with suppress(CancelledError):
             await task
+    await flusher.flush()
+    await history.flush()
+    await subject_tracker.flush()
+    await cluster.leave()
+    warm_start.save_to_file(registry)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    loop = get_event_loop()
+    tasks = start_diagnostics(loop)
+
+    hub_id = hub.load_from_file()
+    mqtt_service.include_router(devices_rst.hub_routes(hub_id))
+    mqtt_service.include_router(cluster_mqt.hub_routes(hub_id))
+
+    await cluster.join()
+    mqtt_task = None
+    if warm_start.restore(registry, cluster.is_owned) is not None:
+        # snapshot devices are served while the database is being read
+        mqtt_task = loop.create_task(mqtt_service.run_durable(mqtt_host=mqtt_host))
+    restored = dict(registry.devices)
+
+    await read_database()
+    if mqtt_task is None:
+        mqtt_task = loop.create_task(mqtt_service.run_durable(mqtt_host=mqtt_host))
+    else:
+        await resubscribe(restored)
+    tasks.append(mqtt_task)
+    tasks += start_workers(loop)
+
+    yield
+
+    await shutdown(tasks)
 
 
 mqtt_service.include_router(devices_mqt.router)
+mqtt_service.include_router(cluster_mqt.router)
 
 # noinspection PyTypeChecker
 app = FastAPI(lifespan=lifespan)
@@ -47,13 +160,53 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+
+@app.middleware("http")
+async def log_slow_requests(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    started = perf_counter()
+    response = await call_next(request)
+    elapsed = perf_counter() - started
+    if 0 < slow_threshold < elapsed:
+        logging.warning(
+            f"Slow request {request.method} {request.url.path}: {elapsed * 1000:.0f} ms"
+        )
+    return response
+
+
 app.include_router(cells_mub.router)
 app.include_router(cells_rst.router)
 app.include_router(devices_rst.router)
+app.include_router(history_rst.router)
+app.include_router(metrics_rst.router)
+app.include_router(subjects_rst.router)
 
 
 @app.post("/test/mosquitto", tags=["test"])
 async def test_mosquitto(topic: str, payload: str) -> None:
     await mqtt_service.publish(topic, payload)
+
+
+@app.get("/api/hub/dispatch", tags=["hub"])
+async def get_dispatch_stats() -> dict[str, int]:
+    return mqtt_service.dispatch_stats()
+
+
+@app.get("/api/hub/cluster", tags=["hub"])
+async def get_cluster() -> dict[str, Any]:
+    return {
+        "hub_id": hub.id,
+        "worker_id": cluster.worker_id,
+        "members": sorted(cluster.members),
+        "devices": len(expiry_scheduler),
+        "paired": len(registry.devices),
+    }
+
+
+@app.get("/api/hub/startup", tags=["hub"])
+async def get_startup_stats() -> dict[str, Any]:
+    return warm_start.stats()
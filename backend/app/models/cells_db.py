@@ -1,7 +1,8 @@
+from collections.abc import Iterator
 from enum import Enum
 from typing import Optional
 
-from odmantic import EmbeddedModel, Model
+from odmantic import EmbeddedModel, Index, Model
 
 from common.types import DeviceType
 
@@ -38,3 +39,9 @@ class Cell(Model):
     subjects: Optional[list[Subject]] = None
 
     devices: list[DeviceType] = []
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            # (y, x) rather than (x, y): also serves the list_cells sort
+            yield Index(Cell.y, Cell.x, unique=True)
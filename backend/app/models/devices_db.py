@@ -1,10 +1,11 @@
+from collections.abc import Iterator
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional
 
-from odmantic import Model, ObjectId
+from odmantic import Index, Model, ObjectId
 
-from common.types import DeviceType
+from common.types import DeviceType, PayloadEncoding
 
 MULTIPLIER: int = 1000
 
@@ -20,6 +21,7 @@ class Device(Model):
     device_id: str
     device_type: DeviceType
     interval: float
+    encoding: PayloadEncoding = PayloadEncoding.TEXT
 
     cell_id: Optional[ObjectId] = None
 
@@ -29,6 +31,12 @@ class Device(Model):
     def mark_active(self) -> None:
         self.expiry = datetime.utcnow() + timedelta(seconds=self.interval * MULTIPLIER)
 
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(Device.device_id, unique=True)
+            yield Index(Device.status, Device.expiry)
+
     @property
     def device_topic(self) -> str:
         return f"{self.device_type.value}/{self.device_id}"
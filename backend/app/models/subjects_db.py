@@ -0,0 +1,41 @@
+from collections.abc import Iterator
+from datetime import datetime
+
+from odmantic import EmbeddedModel, Index, Model, ObjectId
+
+
+class SubjectLocation(Model):
+    """Last place a camera saw the subject at"""
+
+    subject_id: int
+    cell_id: ObjectId
+    x: int
+    y: int
+    last_seen: datetime
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(SubjectLocation.subject_id, unique=True)
+            yield Index(SubjectLocation.cell_id)
+
+
+class TrackPoint(EmbeddedModel):
+    at: datetime
+    cell_id: ObjectId
+    x: int
+    y: int
+
+
+class SubjectTrack(Model):
+    """Moves of one subject during one hour"""
+
+    subject_id: int
+    start: datetime
+
+    points: list[TrackPoint] = []
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(SubjectTrack.subject_id, SubjectTrack.start, unique=True)
@@ -0,0 +1,73 @@
+from collections.abc import Iterator
+from datetime import datetime
+from enum import Enum
+
+from odmantic import EmbeddedModel, Index, Model, ObjectId
+
+
+class TelemetryKind(str, Enum):
+    TEMPERATURE = "temperature"
+    ILLUMINATION = "illumination"
+
+
+class RollupResolution(str, Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+
+
+class TelemetrySample(EmbeddedModel):
+    at: datetime
+    value: float
+
+
+class TelemetryBucket(Model):
+    """Raw samples of one device for one hour"""
+
+    device_id: str
+    cell_id: ObjectId
+    kind: TelemetryKind
+    start: datetime
+
+    samples: list[TelemetrySample] = []
+    count: int = 0
+    total: float = 0
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(
+                TelemetryBucket.device_id,
+                TelemetryBucket.kind,
+                TelemetryBucket.start,
+                unique=True,
+            )
+            yield Index(
+                TelemetryBucket.cell_id,
+                TelemetryBucket.kind,
+                TelemetryBucket.start,
+            )
+
+
+class TelemetryRollup(Model):
+    """Aggregate of all samples of one cell over a minute or an hour"""
+
+    cell_id: ObjectId
+    kind: TelemetryKind
+    resolution: RollupResolution
+    start: datetime
+
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(
+                TelemetryRollup.cell_id,
+                TelemetryRollup.kind,
+                TelemetryRollup.resolution,
+                TelemetryRollup.start,
+                unique=True,
+            )
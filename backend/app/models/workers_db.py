@@ -0,0 +1,16 @@
+from collections.abc import Iterator
+from datetime import datetime
+
+from odmantic import Index, Model
+
+
+class HubWorker(Model):
+    """Heartbeat of one hub process of a cluster"""
+
+    worker_id: str
+    heartbeat: datetime
+
+    class Config:
+        @staticmethod
+        def indexes() -> Iterator[Index]:
+            yield Index(HubWorker.worker_id, unique=True)
@@ -2,11 +2,13 @@ from typing import Optional
 
 from fastapi import APIRouter, HTTPException
 from odmantic import ObjectId
+from odmantic.exceptions import DuplicateKeyError
 from pydantic import BaseModel
-from starlette.status import HTTP_404_NOT_FOUND
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
 
-from app.common.config import engine
+from app.common.config import broadcaster, engine, grid, registry
 from app.models.cells_db import Cell, ClimateMode, LightMode, Subject
+from app.routes.cluster_mqt import cell_changed, update_cell_fields
 from common.types import DeviceType
 
 router = APIRouter(prefix="/admin/cells")
@@ -20,7 +22,15 @@ class CellInput(BaseModel):
 @router.post("")
 async def create_cell(data: CellInput) -> Cell:
     cell: Cell = Cell(**data.dict())
-    await engine.save(cell)
+    try:
+        await engine.save(cell)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=HTTP_409_CONFLICT, detail="Cell with these coordinates exists"
+        )
+    grid.update(cell)
+    broadcaster.publish(cell)
+    await cell_changed(cell.id, set())
     return cell
 
 
@@ -38,9 +48,14 @@ class CellUpdate(BaseModel):
 
 @router.put("/{cell_id}")
 async def update_cell(data: CellUpdate, cell_id: ObjectId) -> Cell:
-    cell = await engine.find_one(Cell, Cell.id == cell_id)
+    cell = registry.get_cell(cell_id) or await engine.find_one(Cell, Cell.id == cell_id)
     if cell is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND)
-    cell.update(data.dict())
-    await engine.save(cell)
-    return cell
+    fields = data.__fields_set__ & set(Cell.__fields__)
+    if not fields:
+        return cell
+    patch = cell.copy(update={name: getattr(data, name) for name in fields})
+    updated = await update_cell_fields(cell_id, {"$set": patch.doc(include=fields)})
+    if updated is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND)
+    return updated
@@ -1,29 +1,221 @@
-from fastapi import APIRouter, HTTPException
-from odmantic import ObjectId
-from starlette.status import HTTP_404_NOT_FOUND
+from contextlib import suppress
+from typing import Annotated, Any
 
-from app.common.config import engine
+from fastapi import (
+    APIRouter,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.encoders import jsonable_encoder
+from odmantic import ObjectId, query
+from starlette.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    WS_1013_TRY_AGAIN_LATER,
+)
+
+from app.common.config import (
+    broadcaster,
+    engine,
+    grid,
+    registry,
+    subject_tracker,
+    versions,
+)
 from app.models.cells_db import Cell
+from app.routes.cluster_mqt import update_cell_fields
 
 router = APIRouter(prefix="/api/cells", tags=["cells"])
 
+CELL_FIELDS: frozenset[str] = frozenset(Cell.__fields__) - {"id"}
+AREA_LIMIT: int = 10000
+MAX_RADIUS: int = 16
+
+Condition = query.QueryExpression | bool
+
+
+def parse_cell_cursor(cursor: str) -> tuple[int, int]:
+    y, _, x = cursor.partition(":")
+    try:
+        return int(y), int(x)
+    except ValueError:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Bad cursor")
+
+
+def project_fields(fields: list[str] | None) -> frozenset[str]:
+    if fields is None:
+        return CELL_FIELDS
+    projected = frozenset(fields) - {"id"} | {"x", "y"}
+    if projected - CELL_FIELDS:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Unknown fields")
+    return projected
+
+
+def area_conditions(
+    min_x: int | None, max_x: int | None, min_y: int | None, max_y: int | None
+) -> list[Condition]:
+    conditions: list[Condition] = []
+    if min_x is not None:
+        conditions.append(Cell.x >= min_x)
+    if max_x is not None:
+        conditions.append(Cell.x <= max_x)
+    if min_y is not None:
+        conditions.append(Cell.y >= min_y)
+    if max_y is not None:
+        conditions.append(Cell.y <= max_y)
+    return conditions
+
+
+def after_condition(after: str) -> Condition:
+    y, x = parse_cell_cursor(after)
+    return query.or_(Cell.y > y, query.and_(Cell.y == y, Cell.x > x))
+
+
+async def read_cells(
+    conditions: list[Condition], projected: frozenset[str], limit: int | None
+) -> list[dict[str, Any]]:
+    cursor = engine.get_collection(Cell).find(
+        query.and_(*conditions) if conditions else {},
+        dict.fromkeys(projected, 1),
+        sort=[("y", 1), ("x", 1)],
+        limit=limit or 0,
+    )
+    cells: list[dict[str, Any]] = []
+    async for document in cursor:
+        cell_id = document.pop("_id")
+        cached = registry.get_cell(cell_id)
+        if cached is not None:  # documents can lag behind the write-behind
+            document.update(jsonable_encoder(cached.dict(include=projected)))
+        document["id"] = str(cell_id)
+        cells.append(document)
+    return cells
+
 
 @router.get("")
-async def list_cells() -> list[Cell]:
+async def list_cells(  # noqa: WPS211
+    response: Response,
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    after: str | None = None,
+    fields: Annotated[list[str] | None, Query()] = None,
+    min_x: int | None = None,
+    max_x: int | None = None,
+    min_y: int | None = None,
+    max_y: int | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> list[dict[str, Any]]:
     """
     Lists all available cells, sorted by coordinates
 
     - sorting: by coordinates (0 0) -> (0 1) -> (1 0) -> (1 1)
-    - filtering: none
+    - filtering: optional inclusive bounding box `min_x`, `max_x`, `min_y`, `max_y`
+    - projection: `fields` limits returned fields, `id`, `x` & `y` are always present
+    - pagination: up to `limit` cells after the `after` cursor,
+      cursor for the next page is returned in the `X-Next-Cursor` header
+    - caching: `ETag` changes with any cell, `If-None-Match` is answered with 304
     """
-    return await engine.find(Cell, sort=(Cell.y, Cell.x))
+    etag = versions.check(Cell, if_none_match)
+    projected = project_fields(fields)
+    conditions = area_conditions(min_x, max_x, min_y, max_y)
+    if after is not None:
+        conditions.append(after_condition(after))
+    cells = await read_cells(conditions, projected, limit)
+
+    response.headers["ETag"] = etag
+    if limit is not None and len(cells) == limit:
+        response.headers["X-Next-Cursor"] = f"{cells[-1]['y']}:{cells[-1]['x']}"
+    return cells
+
+
+async def find_cells(cell_ids: list[ObjectId]) -> list[Cell]:
+    """Loads cells by ids keeping the order, cached copies are preferred"""
+    missing = [cell_id for cell_id in cell_ids if registry.get_cell(cell_id) is None]
+    loaded = {
+        cell.id: cell for cell in await engine.find(Cell, query.in_(Cell.id, missing))
+    }
+    cells = (registry.get_cell(cell_id) or loaded.get(cell_id) for cell_id in cell_ids)
+    return [cell for cell in cells if cell is not None]
+
+
+@router.get("/area")
+async def list_area(
+    min_x: int,
+    max_x: int,
+    min_y: int,
+    max_y: int,
+    limit: Annotated[int, Query(gt=0)] = AREA_LIMIT,
+) -> list[dict[str, Any]]:
+    """
+    Lists ids and coordinates of cells inside the inclusive bounding box
+
+    Answered from the in-memory grid index, sorted by coordinates like the
+    full listing, use it to find which cells a map viewport shows
+    """
+    if max_x < min_x or max_y < min_y:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Empty area")
+    positions = grid.area(min_x, max_x, min_y, max_y)[:limit]
+    return [{"id": str(grid.cells[x, y]), "x": x, "y": y} for x, y in positions]
+
+
+@router.get("/subjects/{subject_id}")
+async def find_subject_cell(subject_id: int) -> Cell:
+    """Cell where the camera last saw the subject"""
+    location = await subject_tracker.locate(subject_id)
+    cell = None
+    if location is not None:
+        cell = registry.get_cell(location.cell_id) or await engine.find_one(
+            Cell, Cell.id == location.cell_id
+        )
+    if cell is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Subject not found")
+    return cell
+
+
+@router.get("/{cell_id}/neighbours")
+async def list_neighbours(
+    cell_id: ObjectId, radius: Annotated[int, Query(gt=0, le=MAX_RADIUS)] = 1
+) -> list[Cell]:
+    """Cells within `radius` steps, diagonals included, sorted by coordinates"""
+    if grid.position(cell_id) is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Cell not found")
+    return await find_cells(grid.neighbours(cell_id, radius))
 
 
 @router.put("/{cell_id}")
 async def require_temperature(cell_id: ObjectId, temperature: int | None) -> None:
-    cell = await engine.find_one(Cell, Cell.id == cell_id)
+    cell = await update_cell_fields(
+        cell_id, {"$set": {"required_temperature": temperature}}
+    )
     if cell is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Cell not found")
 
-    cell.required_temperature = temperature
-    await engine.save(cell)
+
+@router.websocket("/stream")
+async def stream_cells(websocket: WebSocket) -> None:
+    """
+    Streams live cell changes
+
+    - first message: `{"type": "snapshot", "cells": [...]}` with all cells
+    - then: `{"type": "diff", "id": ..., "changes": {...}}` per changed cell
+    - closed with 1013 if the client can't keep up with the changes
+    """
+    await websocket.accept()
+    subscription = broadcaster.subscribe()
+    try:
+        with suppress(WebSocketDisconnect):
+            cells = await engine.find(Cell, sort=(Cell.y, Cell.x))
+            snapshot = [registry.get_cell(cell.id) or cell for cell in cells]
+            await websocket.send_json(
+                {"type": "snapshot", "cells": jsonable_encoder(snapshot)}
+            )
+            while True:  # noqa: WPS457
+                diff = await subscription.queue.get()
+                if diff is None:
+                    await websocket.close(WS_1013_TRY_AGAIN_LATER, "Slow consumer")
+                    return
+                await websocket.send_json(diff)
+    finally:
+        broadcaster.unsubscribe(subscription)
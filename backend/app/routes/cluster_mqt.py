@@ -0,0 +1,204 @@
+import json
+import logging
+from asyncio import gather, sleep
+from typing import Any
+
+from asyncio_mqtt import Message, MqttError
+from odmantic import ObjectId, query
+from pymongo import ReturnDocument
+
+from app.common.config import (
+    broadcaster,
+    climate,
+    cluster,
+    cluster_relay_interval,
+    engine,
+    expiry_scheduler,
+    flusher,
+    grid,
+    hub,
+    mqtt_service,
+    registry,
+    subscriptions,
+    versions,
+    worker_id,
+)
+from app.common.expiry import ALIVE_STATUSES
+from app.models.cells_db import Cell
+from app.models.devices_db import Device, DeviceStatus
+from common.mqtt_service import MQTTRouter
+from common.utils import id_from_message
+
+router = MQTTRouter()
+
+
+async def release_device(device_id: str) -> None:
+    """Drops the process-local state of a device"""
+    device = registry.remove(device_id)
+    if device is not None:
+        await subscriptions.unsubscribe(device)
+    expiry_scheduler.discard(device_id)
+    climate.forget(device_id)
+
+
+async def find_uncached_cells(devices: list[Device]) -> dict[ObjectId, Cell]:
+    cell_ids = [
+        device.cell_id
+        for device in devices
+        if device.cell_id is not None and registry.get_cell(device.cell_id) is None
+    ]
+    return {
+        cell.id: cell for cell in await engine.find(Cell, query.in_(Cell.id, cell_ids))
+    }
+
+
+async def adopt_devices(devices: list[Device]) -> None:
+    """Takes alive devices loaded from the database into the local state"""
+    paired = [device for device in devices if device.status == DeviceStatus.PAIRED]
+    cells = await find_uncached_cells(paired)
+
+    await subscriptions.subscribe(paired)
+    for device in paired:
+        cell_id = device.cell_id
+        registry.add(device, None if cell_id is None else cells.get(cell_id))
+    for alive in devices:
+        expiry_scheduler.schedule(alive)
+
+
+async def reload_device(device_id: str) -> None:
+    await release_device(device_id)
+    device = await engine.find_one(Device, Device.device_id == device_id)
+    if device is not None and device.status in ALIVE_STATUSES:
+        await adopt_devices([device])
+
+
+async def device_changed(device_id: str) -> None:
+    """Reloads the device on the worker that owns it"""
+    if cluster.is_owned(device_id):
+        await reload_device(device_id)
+    else:
+        await mqtt_service.publish(f"cluster/{hub.id}/device", device_id)
+
+
+async def devices_changed(devices: list[Device]) -> None:
+    """Takes the saved state of many devices on the workers that own them"""
+    owned = [device for device in devices if cluster.is_owned(device.device_id)]
+    for released in owned:
+        await release_device(released.device_id)
+    await adopt_devices([device for device in owned if device.status in ALIVE_STATUSES])
+    await gather(
+        *(
+            mqtt_service.publish(f"cluster/{hub.id}/device", device.device_id)
+            for device in devices
+            if not cluster.is_owned(device.device_id)
+        ),
+    )
+
+
+async def cell_changed(cell_id: ObjectId, fields: set[str]) -> None:
+    """Refreshes the fields of the cell cached by the other workers"""
+    if cluster.enabled:
+        change = {"id": str(cell_id), "fields": sorted(fields)}
+        await mqtt_service.publish(f"cluster/{hub.id}/cell", json.dumps(change))
+
+
+async def cell_saved(cell: Cell, fields: set[str]) -> Cell:
+    """
+    Takes the fields of a cell just written to the database into the cached
+    copies and the stream, returns the cached cell if there is one
+    """
+    registry.refresh_cell(cell, fields)
+    cached = registry.get_cell(cell.id) or cell
+    broadcaster.publish(cached, fields)
+    await cell_changed(cell.id, fields)
+    return cached
+
+
+async def update_cell_fields(cell_id: ObjectId, update: dict[str, Any]) -> Cell | None:
+    """
+    Applies an update to the stored cell, workers cache their own copies of
+    cells, so saving a whole copy would overwrite fields other workers wrote
+    """
+    document = await engine.get_collection(Cell).find_one_and_update(
+        {"_id": cell_id}, update, return_document=ReturnDocument.AFTER
+    )
+    if document is None:
+        return None
+    fields = {name for changes in update.values() for name in changes}
+    return await cell_saved(Cell.parse_doc(document), fields)
+
+
+async def handle_device_changed(message: Message) -> None:
+    device_id = id_from_message(message)
+    if cluster.is_owned(device_id):
+        await reload_device(device_id)
+
+
+async def handle_cell_changed(message: Message) -> None:
+    if not isinstance(message.payload, (bytes, str)):
+        return
+    change = json.loads(message.payload)
+    cell = await engine.find_one(Cell, Cell.id == ObjectId(change["id"]))
+    if cell is not None:
+        grid.update(cell)
+        registry.refresh_cell(cell, set(change["fields"]))
+        versions.apply([Cell.__name__])
+
+
+async def relay_changes() -> None:
+    """
+    Sends stream diffs and ETag bumps of this worker to the others, so
+    their stream subscribers and cached listings see cells and devices
+    handled here
+    """
+    while True:  # noqa: WPS457
+        await sleep(cluster_relay_interval)
+        diffs, model_names = broadcaster.drain(), versions.drain()
+        if not (diffs or model_names) or mqtt_service.client is None:
+            continue  # changes made while disconnected are only seen locally
+        changes = {"worker_id": worker_id, "diffs": diffs, "versions": model_names}
+        try:
+            await mqtt_service.publish(f"cluster/{hub.id}/changes", json.dumps(changes))
+        except (MqttError, EnvironmentError) as e:
+            logging.error("Relaying changes to the cluster failed", exc_info=e)
+
+
+async def handle_changes(message: Message) -> None:
+    if not isinstance(message.payload, (bytes, str)):
+        return
+    changes = json.loads(message.payload)
+    if changes["worker_id"] == worker_id:
+        return
+    versions.apply(changes["versions"])
+    broadcaster.receive(changes["diffs"])
+
+
+def hub_routes(hub_id: str) -> MQTTRouter:
+    """Routes of the cluster topics, added once the hub id is loaded"""
+    hub_router = MQTTRouter()
+    hub_router.route(f"cluster/{hub_id}/device")(handle_device_changed)
+    hub_router.route(f"cluster/{hub_id}/cell")(handle_cell_changed)
+    hub_router.route(f"cluster/{hub_id}/changes")(handle_changes)
+    return hub_router
+
+
+def is_adoptable(device_id: str) -> bool:
+    """Owned by this worker since the rebalance and not scheduled yet"""
+    return cluster.is_owned(device_id) and device_id not in expiry_scheduler.devices
+
+
+@cluster.on_rebalance
+async def rebalance_devices() -> None:
+    released = [
+        device_id
+        for device_id in registry.devices.keys() | expiry_scheduler.devices.keys()
+        if not cluster.is_owned(device_id)
+    ]
+    for device_id in released:
+        await release_device(device_id)
+    await flusher.flush()  # lets the new owners load the latest state
+
+    alive = await engine.find(Device, query.in_(Device.status, list(ALIVE_STATUSES)))
+    adopted = [device for device in alive if is_adoptable(device.device_id)]
+    await adopt_devices(adopted)
+    logging.info(f"Rebalanced: {len(released)} released, {len(adopted)} adopted")
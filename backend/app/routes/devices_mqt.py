@@ -1,20 +1,51 @@
 import logging
 from asyncio import sleep
 from collections.abc import Callable
-from datetime import datetime
-from typing import Protocol
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from time import perf_counter
+from types import MappingProxyType
+from typing import Any, Protocol
 
 from asyncio_mqtt import Message
+from odmantic import query
 from pydantic import parse_raw_as
 
-from app.common.config import engine, hub_id, mqtt_service
-from app.models.cells_db import Cell, ClimateMode, LightMode, Subject
-from app.models.devices_db import Device, DeviceStatus
+from app.common.config import (
+    broadcaster,
+    climate,
+    cluster,
+    engine,
+    expiry_scheduler,
+    flusher,
+    history,
+    hub,
+    mqtt_service,
+    registry,
+    subject_tracker,
+    subscriptions,
+    versions,
+    warm_start,
+)
+from app.common.subjects import subject_models
+from app.models.cells_db import Cell, LightMode, Subject
+from app.models.devices_db import MULTIPLIER, Device, DeviceStatus
+from app.models.telemetry_db import TelemetryKind
+from common.codecs import SubjectTuple, decode_samples, decode_subjects
 from common.mqtt_service import MQTTHandlerProtocol, MQTTRouter
-from common.types import DeviceType
+from common.types import DeviceType, PayloadEncoding
 
 router = MQTTRouter()
 
+PAIRING_STATUSES: tuple[DeviceStatus, ...] = (DeviceStatus.READY, DeviceStatus.PAIRING)
+EXPIRY_MILLISECONDS: MappingProxyType[str, Any] = MappingProxyType(
+    {"$multiply": ["$interval", MULTIPLIER * 1000]}
+)
+FRAME_DIGEST_SIZE: int = 16
+# a light turned on stays on up to LIGHT_OFF_FROM, so its own lux don't turn it off
+LIGHT_ON_BELOW: float = 500
+LIGHT_OFF_FROM: float = 1000
+
 
 class DeviceProtocol(Protocol):
     async def __call__(
@@ -26,127 +57,201 @@ class DeviceProtocol(Protocol):
         pass
 
 
+def is_pairing(device_id: str) -> bool:
+    """With wildcards telemetry also comes from devices that are being paired"""
+    device = expiry_scheduler.devices.get(device_id)
+    return device is not None and device.status in PAIRING_STATUSES
+
+
+async def cancel_unknown(device_id: str) -> None:
+    if not is_pairing(device_id) and cluster.is_owned(device_id):
+        await mqtt_service.publish(f"pairing/cancel/{device_id}", hub.id)
+
+
+async def handle_device(
+    function: DeviceProtocol, device: Device, message: Message
+) -> None:
+    cell = registry.get_cell(device.cell_id)
+    await function(device, cell, message)
+    if cell is not None:
+        # read before the flusher clears them
+        broadcaster.publish(cell, set(cell.__fields_modified__))
+        flusher.mark(cell)
+    device.mark_active()
+    flusher.mark(device)  # expiry alone doesn't change the ETag
+
+
 def device_parser() -> Callable[[DeviceProtocol], MQTTHandlerProtocol]:
     def device_parser_wrapper(function: DeviceProtocol) -> MQTTHandlerProtocol:
         async def device_parser_inner(message: Message) -> None:
+            warm_start.telemetry_received()
             device_id: str = message.topic.value.partition("/")[2]
-            device = await engine.find_one(
-                Device,
-                Device.device_id == device_id,
-                Device.status == DeviceStatus.PAIRED,
-            )
+            device = registry.get(device_id)
             if device is None:
-                await mqtt_service.publish(f"pairing/cancel/{device_id}", hub_id)
+                await cancel_unknown(device_id)
             else:
-                cell = await engine.find_one(Cell, Cell.id == device.cell_id)
-                await function(device, cell, message)
-                if cell is not None:
-                    await engine.save(cell)
-                device.mark_active()
-                await engine.save(device)
+                await handle_device(function, device, message)
 
         return device_parser_inner
 
     return device_parser_wrapper
 
 
-@router.route(f"{DeviceType.ECHO.value}/#", subscribe=False)
+@router.route(f"{DeviceType.ECHO.value}/#", subscribe=subscriptions.is_wildcard)
 @device_parser()
 async def handle_echo(_: Device, __: Cell, message: Message) -> None:
     logging.info(message.payload)
 
 
-async def set_climate_mode(
-    device: Device, cell: Cell, climate_mode: ClimateMode
-) -> None:
-    cell.climate_mode = climate_mode
-    if climate_mode != ClimateMode.BROKEN:
-        await mqtt_service.publish(
-            f"climate/{climate_mode.value}/{device.device_id}", None
+def record_samples(
+    device: Device, cell: Cell, kind: TelemetryKind, message: Message
+) -> float | None:
+    """Passes every sample of a frame to history, returns the newest value"""
+    if not isinstance(message.payload, bytes):
+        return None
+    try:
+        samples = decode_samples(message.payload, device.encoding)
+    except ValueError as e:
+        logging.warning(f"Bad data for {kind.value}", exc_info=e)
+        return None
+    if not samples:
+        return None
+
+    now = datetime.utcnow()
+    for age, value in samples:
+        history.record(
+            device.device_id, cell.id, kind, value, now - timedelta(seconds=age)
         )
+    return samples[-1][1]  # frames are sent oldest first
 
 
-@router.route(f"{DeviceType.TEMPERATURE_SENSOR.value}/#", subscribe=False)
+@router.route(
+    f"{DeviceType.TEMPERATURE_SENSOR.value}/#", subscribe=subscriptions.is_wildcard
+)
 @device_parser()
 async def handle_temperature(device: Device, cell: Cell, message: Message) -> None:
-    if not isinstance(message.payload, bytes):
+    value = record_samples(device, cell, TelemetryKind.TEMPERATURE, message)
+    if value is None:
         return
-    try:
-        value = float(message.payload.decode("utf-8"))
-    except ValueError as e:
-        logging.warning("Bad data for temperature", exc_info=e)
 
     cell.temperature = value
-    if cell.required_temperature is None:
-        await set_climate_mode(device, cell, ClimateMode.BROKEN)
-    elif value > cell.required_temperature + 1:
-        await set_climate_mode(device, cell, ClimateMode.COOLING)
-    elif value < cell.required_temperature - 1:
-        await set_climate_mode(device, cell, ClimateMode.HEATING)
-    elif cell.required_temperature - 0.1 <= value <= cell.required_temperature + 0.1:
-        await set_climate_mode(device, cell, ClimateMode.READY)
+    climate.update(device.device_id, cell, value)
 
 
-@router.route(f"{DeviceType.ILLUMINATION_SENSOR.value}/#", subscribe=False)
+@router.route(
+    f"{DeviceType.ILLUMINATION_SENSOR.value}/#", subscribe=subscriptions.is_wildcard
+)
 @device_parser()
-async def handle_illumination(cell: Cell, message: Message) -> None:
-    if not isinstance(message.payload, bytes):
+async def handle_illumination(device: Device, cell: Cell, message: Message) -> None:
+    value = record_samples(device, cell, TelemetryKind.ILLUMINATION, message)
+    if value is None:
         return
-    try:
-        value = float(message.payload.decode("utf-8"))
-    except ValueError as e:
-        logging.warning("Bad data for illumination", exc_info=e)
 
     cell.illumination = value
-    if cell.illumination < 500:
-        cell.light_mode = LightMode.ON
+    if value < LIGHT_ON_BELOW:
+        light_mode = LightMode.ON
+    elif value >= LIGHT_OFF_FROM or cell.light_mode is None:
+        light_mode = LightMode.OFF
     else:
-        cell.light_mode = LightMode.OFF
+        return
+    if light_mode != cell.light_mode:
+        cell.light_mode = light_mode
+        await mqtt_service.publish(f"light/{light_mode.value}/{device.device_id}", None)
 
 
-@router.route(f"{DeviceType.CAMERA.value}/#", subscribe=False)
+def parse_subjects(payload: bytes, encoding: PayloadEncoding) -> list[SubjectTuple]:
+    """Decodes a camera frame, loosely typed JSON goes through the models"""
+    try:
+        return decode_subjects(payload, encoding)
+    except ValueError:
+        if encoding == PayloadEncoding.BINARY:
+            raise
+    parsed = parse_raw_as(list[Subject], payload)
+    return [(subject.x, subject.y, subject.subject_id) for subject in parsed]
+
+
+@router.route(f"{DeviceType.CAMERA.value}/#", subscribe=subscriptions.is_wildcard)
 @device_parser()
-async def handle_camera(cell: Cell, message: Message) -> None:
-    if not isinstance(message.payload, (bytes, str)):
+async def handle_camera(device: Device, cell: Cell, message: Message) -> None:
+    if isinstance(message.payload, bytes):
+        payload, encoding = message.payload, device.encoding
+    elif isinstance(message.payload, str):
+        payload, encoding = message.payload.encode("utf-8"), PayloadEncoding.TEXT
+    else:
+        return
+
+    # cameras resend the same frame while nothing moves
+    digest = blake2b(payload, digest_size=FRAME_DIGEST_SIZE).digest()
+    if subject_tracker.is_repeat(cell.id, digest):
+        return
+
+    try:
+        subjects = parse_subjects(payload, encoding)
+    except ValueError as e:
+        logging.warning("Bad data for camera", exc_info=e)
         return
 
-    cell.subjects = parse_raw_as(list[Subject], message.payload)
+    # unchanged frames keep the list, so the flusher doesn't write it again
+    if subject_tracker.has_changed(cell.id, subjects, digest=digest):
+        cell.subjects = subject_models(subjects, cell.subjects)
+
+
+async def expire_device(device: Device) -> None:
+    logging.info(f"Device {device.id}/{device.device_id} has been expired")
+    await mqtt_service.publish(f"pairing/cancel/{device.device_id}", hub.id)
+    await subscriptions.unsubscribe(device)
+    device.status = DeviceStatus.DEAD
+    await engine.save(device)
+    versions.bump(Device)
+    registry.remove(device.device_id)
+    climate.forget(device.device_id)
+
+
+async def expire_or_retry(device: Device) -> None:
+    status = device.status
+    try:
+        await expire_device(device)
+    except Exception as e:
+        # a broker or database outage mustn't stop the sweeps
+        logging.error(f"Expiring {device.device_id} failed", exc_info=e)
+        device.status = status
+        expiry_scheduler.schedule(device)  # retried on the next sweep
+    else:
+        expiry_scheduler.expired += 1
 
 
 async def expiry_cleaner() -> None:
     while True:  # noqa: WPS457
+        await sleep(expiry_scheduler.precision)
         if mqtt_service.client is None:
-            await sleep(10)
             continue
 
-        logging.info("Expired device purge in progress")
+        started = perf_counter()
+        for device in expiry_scheduler.pop_expired(datetime.utcnow()):
+            await expire_or_retry(device)
+        expiry_scheduler.sweep_duration.observe(perf_counter() - started)
 
-        async for device in engine.find(
-            Device,
-            Device.status != DeviceStatus.DEAD,
-            Device.expiry < datetime.utcnow(),
-        ):
-            logging.info(f"Device {device.id}/{device.device_id} has been expired")
-            await mqtt_service.publish(f"pairing/cancel/{device.device_id}", hub_id)
-            await mqtt_service.client.unsubscribe(device.device_topic)
-            device.status = DeviceStatus.DEAD
-            await engine.save(device)
 
-        await sleep(100)
+@mqtt_service.on_connect
+async def reconnect_devices() -> None:
+    if mqtt_service.client is None:
+        return
+    climate.reset()  # commands sent while disconnected may be lost
 
+    now = datetime.utcnow()
+    devices = [device for device in registry.devices.values() if device.expiry >= now]
+    if not devices:
+        return  # expired ones are left for the expiry_cleaner
 
-async def reconnect_devices() -> None:
-    while True:
-        if mqtt_service.client is not None:
-            break
-        await sleep(10)
-
-    async for device in engine.find(
-        Device,
-        Device.status == DeviceStatus.PAIRED,
-        Device.expiry >= datetime.utcnow(),
-    ):
-        await mqtt_service.client.subscribe(device.device_topic)
-        device.mark_active()
-        await engine.save(device)
-        logging.info(f"Device {device.id}/{device.device_id} reconnected successfully")
+    await subscriptions.subscribe(devices)
+
+    for reconnected in devices:
+        reconnected.mark_active()
+    await engine.get_collection(Device).update_many(
+        query.and_(
+            Device.status == DeviceStatus.PAIRED,
+            query.in_(Device.device_id, [device.device_id for device in devices]),
+        ),
+        [{"$set": {"expiry": {"$add": ["$$NOW", EXPIRY_MILLISECONDS]}}}],
+    )
+    logging.info(f"Devices reconnected successfully: {len(devices)}")
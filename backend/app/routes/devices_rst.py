@@ -1,32 +1,91 @@
 import logging
+from asyncio import gather
+from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import Annotated
 
 from asyncio_mqtt import Message
-from fastapi import APIRouter, HTTPException
-from odmantic import ObjectId
-from pydantic import ValidationError
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from odmantic import ObjectId, query
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
 from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from app.common.config import engine, hub_id, mqtt_service
+from app.common.config import (
+    climate,
+    cluster,
+    engine,
+    expiry_scheduler,
+    hub,
+    mqtt_service,
+    pairing,
+    registry,
+    subscriptions,
+    versions,
+)
 from app.models.cells_db import Cell
 from app.models.devices_db import Device, DeviceStatus
-from common.types import DeviceInfo
+from app.routes.cluster_mqt import (
+    cell_saved,
+    device_changed,
+    devices_changed,
+    update_cell_fields,
+)
+from common.mqtt_service import MQTTRouter
+from common.types import DeviceInfo, DeviceType
 from common.utils import id_from_message
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 
+READY_FIELDS: frozenset[str] = frozenset(
+    ("device_id", "device_type", "interval", "encoding", "status", "expiry")
+)
+
 
 @router.get("")
-async def get_devices() -> list[Device]:
-    return await engine.find(Device)
+async def get_devices(  # noqa: WPS211
+    response: Response,
+    status: DeviceStatus | None = None,
+    device_type: DeviceType | None = None,
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    after: ObjectId | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> list[Device]:
+    """
+    Lists devices in the order of creation
+
+    - filtering: optional `status` and `device_type`
+    - pagination: up to `limit` devices after the `after` device id,
+      cursor for the next page is returned in the `X-Next-Cursor` header
+    - caching: `ETag` changes with status, cell or pairing of any device,
+      `If-None-Match` is answered with 304. `expiry` moves with every
+      message and isn't covered, a cached page can show an older one
+    """
+    etag = versions.check(Device, if_none_match)
+
+    conditions: list[query.QueryExpression | bool] = []
+    if status is not None:
+        conditions.append(Device.status == status)
+    if device_type is not None:
+        conditions.append(Device.device_type == device_type)
+    if after is not None:
+        conditions.append(Device.id > after)
+
+    devices = await engine.find(Device, *conditions, sort=Device.id, limit=limit)
+    # paired devices can be fresher in the registry due to the write-behind
+    devices = [registry.get(device.device_id) or device for device in devices]
+
+    response.headers["ETag"] = etag
+    if limit is not None and len(devices) == limit:
+        response.headers["X-Next-Cursor"] = str(devices[-1].id)
+    return devices
 
 
 @router.post("/scan")
 async def perform_device_scan() -> None:
-    await mqtt_service.publish("pairing/scan", hub_id)
+    await mqtt_service.publish("pairing/scan", hub.id)
 
 
-@mqtt_service.route(f"pairing/ready/{hub_id}")
 async def handle_pairing_ready(message: Message) -> None:
     try:
         if isinstance(message.payload, (str, bytes)):
@@ -37,31 +96,70 @@ async def handle_pairing_ready(message: Message) -> None:
     except ValidationError as e:
         logging.warning("Bad ready message received", exc_info=e)
         return
+    if cluster.is_owned(device_info.id):
+        pairing.add_ready(device_info)
 
+
+def ready_device(
+    info: DeviceInfo, existing: Device | None, expiry: datetime
+) -> Device | None:
+    """Device announced as ready, None if it is already paired or pairing"""
     device_data = {
-        "device_id": device_info.id,
-        "device_type": device_info.type,
-        "interval": device_info.interval,
+        "device_id": info.id,
+        "device_type": info.type,
+        "interval": info.interval,
+        "encoding": info.encoding,
         "status": DeviceStatus.READY,
-        "expiry": datetime.utcnow() + timedelta(minutes=1),
+        "expiry": expiry,
     }
+    if existing is None:
+        return Device(**device_data)  # type: ignore
+    if existing.status in {DeviceStatus.READY, DeviceStatus.DEAD}:
+        existing.update(device_data)
+        return existing
+    logging.warning(f"Paring error: device {info.id} already exists as {existing.id}")
+    return None
 
-    device = await engine.find_one(Device, Device.device_id == device_info.id)
-    if device is None:
-        device = Device(**device_data)  # type: ignore
-    elif device.status in {DeviceStatus.READY, DeviceStatus.DEAD}:
-        device.update(device_data)
-    else:
-        logging.warning(
-            f"Paring error: device {device_info.id} already exists as {device.id}"
+
+async def process_ready(infos: list[DeviceInfo]) -> None:
+    existing = {
+        stored.device_id: stored
+        for stored in await engine.find(
+            Device, query.in_(Device.device_id, [info.id for info in infos])
         )
+    }
+    expiry = datetime.utcnow() + timedelta(minutes=1)
+    devices = list(
+        filter(
+            None,
+            (ready_device(info, existing.get(info.id), expiry) for info in infos),
+        ),
+    )
+    if not devices:
         return
-    await engine.save(device)
+
+    await engine.get_collection(Device).bulk_write(
+        [
+            UpdateOne(
+                {"device_id": ready.device_id},
+                {
+                    "$set": ready.doc(include=READY_FIELDS),
+                    "$setOnInsert": {"_id": ready.id, "cell_id": None},
+                },
+                upsert=True,
+            )
+            for ready in devices
+        ],
+        ordered=False,
+    )
+    versions.bump(Device)
+    for device in devices:
+        expiry_scheduler.schedule(device)
 
 
 @router.put("/{device_id}/pair")
 async def pair_device(device_id: ObjectId, cell_id: ObjectId) -> None:
-    cell = await engine.find_one(Cell, Cell.id == cell_id)
+    cell = registry.get_cell(cell_id) or await engine.find_one(Cell, Cell.id == cell_id)
 
     if cell is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Cell not found")
@@ -73,36 +171,199 @@ async def pair_device(device_id: ObjectId, cell_id: ObjectId) -> None:
     if device.status != DeviceStatus.READY:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Wrong state")
 
-    cell.devices.append(device.device_type)
+    await update_cell_fields(cell.id, {"$push": {"devices": device.device_type.value}})
     device.cell_id = cell.id
-    await engine.save(cell)
 
-    await mqtt_service.publish(f"pairing/start/{device.device_id}", hub_id)
+    await mqtt_service.publish(f"pairing/start/{device.device_id}", hub.id)
     device.status = DeviceStatus.PAIRING
     device.expiry = datetime.utcnow() + timedelta(minutes=1)
     await engine.save(device)
+    versions.bump(Device)
+    await device_changed(device.device_id)
+
+
+class PairingRequest(BaseModel):
+    device_id: ObjectId
+    cell_id: ObjectId
+
+
+class BulkPairingResult(BaseModel):
+    pairing: list[ObjectId] = []
+    failed: dict[str, str] = {}
+
+
+async def find_cell_ids(cell_ids: set[ObjectId]) -> set[ObjectId]:
+    """Ids of the cells that exist, cached cells aren't read again"""
+    cached = {cell_id for cell_id in cell_ids if registry.get_cell(cell_id) is not None}
+    stored = await engine.find(Cell, query.in_(Cell.id, list(cell_ids - cached)))
+    return cached | {cell.id for cell in stored}
+
+
+def check_pairing(
+    assigned: dict[ObjectId, ObjectId],
+    devices: list[Device],
+    cell_ids: set[ObjectId],
+    result: BulkPairingResult,
+) -> list[Device]:
+    """Devices that can be paired, the others are reported in the result"""
+    found = {device.id for device in devices}
+    for device_id in assigned:
+        if device_id not in found:
+            result.failed[str(device_id)] = "Device not found"
+
+    ready = []
+    for device in devices:
+        if assigned[device.id] not in cell_ids:
+            result.failed[str(device.id)] = "Cell not found"
+        elif device.status == DeviceStatus.READY:
+            ready.append(device)
+        else:
+            result.failed[str(device.id)] = "Wrong state"
+    return ready
+
+
+async def push_cell_devices(
+    devices: list[Device], assigned: dict[ObjectId, ObjectId]
+) -> None:
+    """Adds the device types to their cells with one bulk write"""
+    pushed: dict[ObjectId, list[str]] = defaultdict(list)
+    for device in devices:
+        pushed[assigned[device.id]].append(device.device_type.value)
+    await engine.get_collection(Cell).bulk_write(
+        [
+            UpdateOne({"_id": cell_id}, {"$push": {"devices": {"$each": types}}})
+            for cell_id, types in pushed.items()
+        ],
+        ordered=False,
+    )
+    for cell in await engine.find(Cell, query.in_(Cell.id, list(pushed))):
+        await cell_saved(cell, {"devices"})
+
+
+async def start_pairing(
+    devices: list[Device], assigned: dict[ObjectId, ObjectId]
+) -> None:
+    """Asks the devices to pair and saves their pairing state with one bulk write"""
+    expiry = datetime.utcnow() + timedelta(minutes=1)
+    for device in devices:
+        device.cell_id = assigned[device.id]
+        device.status = DeviceStatus.PAIRING
+        device.expiry = expiry
+    await gather(
+        *(
+            mqtt_service.publish(f"pairing/start/{pairing_device.device_id}", hub.id)
+            for pairing_device in devices
+        ),
+    )
+    await engine.get_collection(Device).bulk_write(
+        [
+            UpdateOne(
+                {"_id": pairing_device.id},
+                {"$set": pairing_device.doc(include={"cell_id", "status", "expiry"})},
+            )
+            for pairing_device in devices
+        ],
+        ordered=False,
+    )
+    versions.bump(Device)
+    await devices_changed(devices)
+
+
+@router.put("/pair")
+async def pair_devices(requests: list[PairingRequest]) -> BulkPairingResult:
+    """Pairs many devices at once, failures are reported per device"""
+    assigned = {request.device_id: request.cell_id for request in requests}
+    devices = await engine.find(Device, query.in_(Device.id, list(assigned)))
+    cell_ids = await find_cell_ids(set(assigned.values()))
+
+    result = BulkPairingResult()
+    paired = check_pairing(assigned, devices, cell_ids, result)
+    if paired:
+        await push_cell_devices(paired, assigned)
+        await start_pairing(paired, assigned)
+    result.pairing = [device.id for device in paired]
+    return result
 
 
-@mqtt_service.route(f"pairing/confirm/{hub_id}")
 async def handle_pairing_confirm(message: Message) -> None:
     device_id = id_from_message(message)
-    device = await engine.find_one(Device, Device.device_id == device_id)
-    if device is None:
-        await mqtt_service.publish(f"pairing/cancel/{device_id}", hub_id)
-    else:
-        if mqtt_service.client is not None:
-            await mqtt_service.client.subscribe(device.device_topic)
+    if cluster.is_owned(device_id):
+        pairing.add_confirm(device_id)
+
+
+def hub_routes(hub_id: str) -> MQTTRouter:
+    """Routes of the pairing topics, added once the hub id is loaded"""
+    hub_router = MQTTRouter()
+    hub_router.route(f"pairing/ready/{hub_id}")(handle_pairing_ready)
+    hub_router.route(f"pairing/confirm/{hub_id}")(handle_pairing_confirm)
+    return hub_router
+
+
+async def mark_paired(devices: list[Device]) -> None:
+    """Marks confirmed devices as paired with one bulk write"""
+    for device in devices:
         device.status = DeviceStatus.PAIRED
         device.mark_active()
-        await engine.save(device)
+    await engine.get_collection(Device).bulk_write(
+        [
+            UpdateOne(
+                {"_id": paired.id},
+                {"$set": paired.doc(include={"status", "expiry"})},
+            )
+            for paired in devices
+        ],
+        ordered=False,
+    )
+    versions.bump(Device)
+
+
+async def register_paired(devices: list[Device]) -> None:
+    """Serves telemetry of paired devices, cells missing in the registry are read"""
+    cell_ids = [
+        paired.cell_id
+        for paired in devices
+        if paired.cell_id is not None and registry.get_cell(paired.cell_id) is None
+    ]
+    cells = {
+        stored.id: stored
+        for stored in await engine.find(Cell, query.in_(Cell.id, cell_ids))
+    }
+    for device in devices:
+        cell = None if device.cell_id is None else cells.get(device.cell_id)
+        registry.add(device, cell)
+        expiry_scheduler.schedule(device)
+        climate.forget(device.device_id)
+
+
+async def process_confirms(device_ids: list[str]) -> None:
+    devices = await engine.find(Device, query.in_(Device.device_id, device_ids))
+    found = {device.device_id for device in devices}
+    await gather(
+        *(
+            mqtt_service.publish(f"pairing/cancel/{device_id}", hub.id)
+            for device_id in device_ids
+            if device_id not in found
+        ),
+    )
+    if devices:
+        await subscriptions.subscribe(devices)
+        await mark_paired(devices)
+        await register_paired(devices)
+
+
+async def process_pairing(ready: list[DeviceInfo], confirmed: list[str]) -> None:
+    if ready:
+        await process_ready(ready)
+    if confirmed:
+        await process_confirms(confirmed)
 
 
 async def unpair(device: Device) -> None:
-    await mqtt_service.publish(f"pairing/cancel/{device.device_id}", hub_id)
-    if mqtt_service.client is not None:
-        await mqtt_service.client.unsubscribe(device.device_topic)
+    await mqtt_service.publish(f"pairing/cancel/{device.device_id}", hub.id)
     device.status = DeviceStatus.DEAD
     await engine.save(device)
+    versions.bump(Device)
+    await device_changed(device.device_id)
 
 
 @router.delete("/{device_id}/pair")
@@ -125,3 +386,5 @@ async def remove_device(device_id: ObjectId) -> None:
     if device.status == DeviceStatus.PAIRED:
         await unpair(device)
     await engine.remove(Device, Device.id == device_id)
+    versions.bump(Device)
+    await device_changed(device.device_id)
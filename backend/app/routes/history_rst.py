@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+
+from fastapi import APIRouter, HTTPException
+from odmantic import ObjectId
+from pydantic import BaseModel
+from starlette.status import HTTP_400_BAD_REQUEST
+
+from app.common.config import engine
+from app.models.telemetry_db import (
+    RollupResolution,
+    TelemetryBucket,
+    TelemetryKind,
+    TelemetryRollup,
+)
+
+router = APIRouter(prefix="/api/cells", tags=["cells"])
+
+
+class HistoryResolution(str, Enum):
+    RAW = "raw"
+    MINUTE = "minute"
+    HOUR = "hour"
+
+
+class HistoryPoint(BaseModel):
+    at: datetime
+    value: float
+    minimum: float
+    maximum: float
+    count: int
+
+
+def naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def pick_resolution(span: timedelta) -> HistoryResolution:
+    if span <= timedelta(hours=1):
+        return HistoryResolution.RAW
+    if span <= timedelta(days=2):
+        return HistoryResolution.MINUTE
+    return HistoryResolution.HOUR
+
+
+async def find_raw_history(
+    cell_id: ObjectId, kind: TelemetryKind, start: datetime, end: datetime
+) -> list[HistoryPoint]:
+    buckets = await engine.find(
+        TelemetryBucket,
+        TelemetryBucket.cell_id == cell_id,
+        TelemetryBucket.kind == kind,
+        TelemetryBucket.start > start - timedelta(hours=1),
+        TelemetryBucket.start <= end,
+    )
+    samples = sorted(
+        (
+            sample
+            for bucket in buckets
+            for sample in bucket.samples
+            if start <= sample.at <= end
+        ),
+        key=lambda sample: sample.at,
+    )
+    return [
+        HistoryPoint(
+            at=sample.at,
+            value=sample.value,
+            minimum=sample.value,
+            maximum=sample.value,
+            count=1,
+        )
+        for sample in samples
+    ]
+
+
+async def find_rollup_history(
+    cell_id: ObjectId,
+    kind: TelemetryKind,
+    resolution: RollupResolution,
+    start: datetime,
+    end: datetime,
+) -> list[HistoryPoint]:
+    rollups = await engine.find(
+        TelemetryRollup,
+        TelemetryRollup.cell_id == cell_id,
+        TelemetryRollup.kind == kind,
+        TelemetryRollup.resolution == resolution,
+        TelemetryRollup.start >= start,
+        TelemetryRollup.start <= end,
+        sort=TelemetryRollup.start,
+    )
+    return [
+        HistoryPoint(
+            at=rollup.start,
+            value=rollup.total / rollup.count,
+            minimum=rollup.minimum,
+            maximum=rollup.maximum,
+            count=rollup.count,
+        )
+        for rollup in rollups
+    ]
+
+
+@router.get("/{cell_id}/history")
+async def get_cell_history(
+    cell_id: ObjectId,
+    kind: TelemetryKind,
+    start: datetime,
+    end: datetime | None = None,
+    resolution: HistoryResolution | None = None,
+) -> list[HistoryPoint]:
+    """
+    Lists telemetry of the cell within `start`..`end` (default: now)
+
+    - resolution: raw samples, minute or hour averages,
+      picked by the length of the range if not set
+    - recent samples become visible after the next history flush
+    """
+    start = naive_utc(start)
+    end = datetime.utcnow() if end is None else naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Empty range")
+
+    resolution = resolution or pick_resolution(end - start)
+    if resolution == HistoryResolution.RAW:
+        return await find_raw_history(cell_id, kind, start, end)
+    return await find_rollup_history(
+        cell_id, kind, RollupResolution(resolution.value), start, end
+    )
@@ -0,0 +1,116 @@
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.status import HTTP_409_CONFLICT
+
+from app.common.config import (
+    device_counts,
+    expiry_scheduler,
+    flusher,
+    history,
+    mongo_metrics,
+    mqtt_service,
+    profiler,
+    registry,
+)
+from common.metrics import Labels, MetricsText
+
+router = APIRouter(tags=["hub"])
+
+PROFILE_SECONDS: float = 10
+PROFILE_MAX_SECONDS: float = 300
+
+
+def describe_mqtt(text: MetricsText) -> None:
+    text.describe("mqtt_handler_seconds", "histogram", "MQTT handler time per route")
+    text.histograms(
+        "mqtt_handler_seconds",
+        (
+            ({"route": route}, latency)
+            for route, latency in mqtt_service.handler_latency.items()
+        ),
+    )
+    text.describe("mqtt_handler_errors_total", "counter", "MQTT handler exceptions")
+    text.samples(
+        "mqtt_handler_errors_total",
+        (
+            ({"route": route}, count)
+            for route, count in mqtt_service.handler_errors.items()
+        ),
+    )
+    text.describe("mqtt_publish_seconds", "histogram", "MQTT publish time")
+    text.histogram("mqtt_publish_seconds", mqtt_service.publish_latency)
+    text.counter(
+        "mqtt_disconnects_total", "Lost broker connections", mqtt_service.disconnects
+    )
+    for name, value in mqtt_service.dispatch_stats().items():
+        text.gauge(f"mqtt_dispatch_{name}", f"Dispatcher {name}", value)
+
+
+def command_labels(key: tuple[str, str]) -> Labels:
+    collection, command = key
+    return {"collection": collection, "command": command}
+
+
+def describe_mongo(text: MetricsText) -> None:
+    with mongo_metrics.lock:
+        latency = [
+            (command_labels(key), histogram)
+            for key, histogram in mongo_metrics.latency.items()
+        ]
+        failures = [
+            (command_labels(key), count)
+            for key, count in mongo_metrics.failures.items()
+        ]
+    text.describe("mongo_command_seconds", "histogram", "MongoDB command time")
+    text.histograms("mongo_command_seconds", latency)
+    text.describe("mongo_command_failures_total", "counter", "Failed MongoDB commands")
+    text.samples("mongo_command_failures_total", failures)
+
+
+async def describe_devices(text: MetricsText) -> None:
+    counts = await device_counts.get()
+    text.describe("hub_devices", "gauge", "Devices in the database by status")
+    text.samples(
+        "hub_devices", (({"status": status}, count) for status, count in counts.items())
+    )
+    text.gauge(
+        "hub_registry_devices", "Paired devices served here", len(registry.devices)
+    )
+
+
+def describe_backlog(text: MetricsText) -> None:
+    text.describe("expiry_sweep_seconds", "histogram", "Expiry sweep time")
+    text.histogram("expiry_sweep_seconds", expiry_scheduler.sweep_duration)
+    text.counter(
+        "expiry_expired_total",
+        "Devices marked dead on expiry",
+        expiry_scheduler.expired,
+    )
+    text.gauge(
+        "flusher_pending", "Documents waiting to be flushed", len(flusher.pending)
+    )
+    text.gauge("history_pending", "Samples waiting to be flushed", history.pending)
+
+
+@router.post("/admin/profile", response_class=PlainTextResponse)
+async def profile_hub(
+    seconds: Annotated[float, Query(gt=0, le=PROFILE_MAX_SECONDS)] = PROFILE_SECONDS
+) -> str:
+    """Samples the event loop for the given time, returns collapsed stacks"""
+    if profiler.is_running:
+        raise HTTPException(
+            status_code=HTTP_409_CONFLICT, detail="Profiler is already running"
+        )
+    return await profiler.profile(seconds)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> str:
+    text = MetricsText()
+    describe_mqtt(text)
+    describe_mongo(text)
+    await describe_devices(text)
+    describe_backlog(text)
+    return text.render()
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+
+from app.common.config import engine, subject_tracker
+from app.common.history import BUCKET_SPAN
+from app.models.subjects_db import SubjectLocation, SubjectTrack, TrackPoint
+from app.routes.history_rst import naive_utc
+
+router = APIRouter(prefix="/api/subjects", tags=["subjects"])
+
+
+@router.get("/{subject_id}")
+async def get_subject(subject_id: int) -> SubjectLocation:
+    """Cell and coordinates where a camera last saw the subject"""
+    location = await subject_tracker.locate(subject_id)
+    if location is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Subject not found")
+    return location
+
+
+@router.get("/{subject_id}/trajectory")
+async def get_subject_trajectory(
+    subject_id: int, start: datetime | None = None, end: datetime | None = None
+) -> list[TrackPoint]:
+    """
+    Lists moves of the subject within `start` (default: an hour ago)..`end`
+    (default: now), oldest first
+
+    - a point is recorded when the subject appears or changes its position
+    - recent moves become visible after the next flush
+    """
+    end = datetime.utcnow() if end is None else naive_utc(end)
+    start = end - timedelta(hours=1) if start is None else naive_utc(start)
+    if end <= start:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Empty range")
+
+    tracks = await engine.find(
+        SubjectTrack,
+        SubjectTrack.subject_id == subject_id,
+        SubjectTrack.start > start - BUCKET_SPAN,
+        SubjectTrack.start <= end,
+    )
+    return sorted(
+        (
+            point
+            for track in tracks
+            for point in track.points
+            if start <= point.at <= end
+        ),
+        key=lambda point: point.at,
+    )
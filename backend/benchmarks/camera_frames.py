@@ -0,0 +1,144 @@
+"""
+Measures the hub's cost per camera frame with 10, 100 and 1000 subjects,
+for JSON and binary payloads, through the real ``device_parser`` (registry
+lookup, cell broadcast, write-behind marks): changed frames, where a tenth
+of the subjects move each frame, and repeated byte-identical frames
+
+Before: the previous ``handle_camera`` body, every frame is validated into
+models, then diffed by the tracker. After: the current handler, repeated
+frames are skipped by the payload digest, changed ones are decoded into
+plain tuples and only subjects that moved are validated
+
+Run with ``python -m benchmarks.camera_frames`` from the backend folder
+"""
+import json
+from asyncio import run
+from datetime import datetime
+from random import randrange
+from time import perf_counter
+
+from asyncio_mqtt import Message
+from pydantic import parse_raw_as
+
+from app.common.config import registry, subject_tracker
+from app.models.cells_db import Cell, Subject
+from app.models.devices_db import Device, DeviceStatus
+from app.routes.devices_mqt import device_parser, router
+from common.codecs import SubjectTuple, decode_subjects, encode_subjects
+from common.mqtt_service import MQTTHandlerProtocol
+from common.types import DeviceType, PayloadEncoding
+
+SUBJECT_COUNTS: tuple[int, ...] = (10, 100, 1000)
+FRAMES: int = 200
+MOVING_SHARE: float = 0.1
+MICROSECONDS: float = 1e6
+
+
+def make_frames(count: int) -> list[list[SubjectTuple]]:
+    frame = [
+        (randrange(1000), randrange(1000), subject_id) for subject_id in range(count)
+    ]
+    frames = [frame]
+    for _ in range(FRAMES - 1):
+        frame = list(frame)
+        for _ in range(max(1, int(count * MOVING_SHARE))):
+            x, y, subject_id = frame[randrange(count)]
+            frame[subject_id] = (x + 1, y, subject_id)
+        frames.append(frame)
+    return frames
+
+
+def encode_frame(subjects: list[SubjectTuple], encoding: PayloadEncoding) -> bytes:
+    if encoding == PayloadEncoding.BINARY:
+        return encode_subjects(subjects)
+    return json.dumps(
+        [{"x": x, "y": y, "subject_id": subject_id} for x, y, subject_id in subjects]
+    ).encode("utf-8")
+
+
+@device_parser()
+async def handle_camera_before(
+    device: Device | None, cell: Cell | None, message: Message
+) -> None:
+    if device is None or cell is None or not isinstance(message.payload, bytes):
+        return
+    if device.encoding == PayloadEncoding.BINARY:
+        subjects = decode_subjects(message.payload, device.encoding)
+    else:
+        parsed = parse_raw_as(list[Subject], message.payload)
+        subjects = [(s.x, s.y, s.subject_id) for s in parsed]
+    if subject_tracker.has_changed(cell.id, subjects):
+        cell.subjects = [Subject(x=x, y=y, subject_id=s) for x, y, s in subjects]
+
+
+def pair_camera(encoding: PayloadEncoding) -> Device:
+    """Registers a fresh camera and cell, so every run starts without frames"""
+    cell = Cell(x=0, y=0)
+    device = Device(
+        device_id=f"camera-{cell.id}",
+        device_type=DeviceType.CAMERA,
+        interval=1,
+        encoding=encoding,
+        cell_id=cell.id,
+        status=DeviceStatus.PAIRED,
+        expiry=datetime.utcnow(),
+    )
+    registry.add(device, cell)
+    return device
+
+
+async def per_frame(
+    handler: MQTTHandlerProtocol, encoding: PayloadEncoding, payloads: list[bytes]
+) -> float:
+    device = pair_camera(encoding)
+    topic = f"{DeviceType.CAMERA.value}/{device.device_id}"
+    messages = [
+        Message(topic, payload, qos=0, retain=False, mid=0, properties=None)
+        for payload in payloads
+    ]
+    await handler(messages[0])  # the first frame of a cell is always new
+    started = perf_counter()
+    for message in messages:
+        await handler(message)
+    return (perf_counter() - started) / len(messages)
+
+
+def encode_runs(
+    frames: list[list[SubjectTuple]], encoding: PayloadEncoding
+) -> dict[str, list[bytes]]:
+    changed = [encode_frame(frame, encoding) for frame in frames]
+    return {"changed": changed, "repeated": [changed[0] for _ in range(FRAMES)]}
+
+
+def report(
+    count: int, encoding: PayloadEncoding, name: str, before: float, after: float
+) -> None:
+    before_us, after_us = before * MICROSECONDS, after * MICROSECONDS
+    columns = f"{before_us:>12.1f} {after_us:>12.1f} {before / after:>7.1f}x"
+    print(f"{count:>8} {encoding.value:>8} {name:>8} {columns}")
+
+
+async def bench_encoding(
+    handle_camera: MQTTHandlerProtocol,
+    count: int,
+    encoding: PayloadEncoding,
+    frames: list[list[SubjectTuple]],
+) -> None:
+    for name, payloads in encode_runs(frames, encoding).items():
+        before = await per_frame(handle_camera_before, encoding, payloads)
+        after = await per_frame(handle_camera, encoding, payloads)
+        report(count, encoding, name, before, after)
+
+
+async def main() -> None:
+    handle_camera = router.handlers[f"{DeviceType.CAMERA.value}/#"]
+    header = f"{'before, us':>12} {'after, us':>12} {'speedup':>8}"
+    print(f"{'subjects':>8} {'encoding':>8} {'frames':>8} {header}")
+    for count in SUBJECT_COUNTS:
+        frames = make_frames(count)
+        for encoding in PayloadEncoding:
+            await bench_encoding(handle_camera, count, encoding, frames)
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,90 @@
+"""
+Compares queries on the in-memory cell grid with a linear scan over all
+cells on a 1000x1000 map: viewport rectangles and neighbours of a cell
+
+Run with ``python -m benchmarks.cell_grid`` from the backend folder
+"""
+from random import randrange
+from time import perf_counter
+from timeit import timeit
+
+from odmantic import ObjectId
+
+from app.common.grid import CellGrid, Position
+
+SIDE: int = 1000
+VIEWPORTS: tuple[int, ...] = (10, 100, 500)
+RECTANGLES: int = 50
+SCANS: int = 5
+LOOKUPS: int = 500
+MICROSECONDS: float = 1e6
+
+Cells = list[tuple[int, int, ObjectId]]
+Rectangle = tuple[int, int, int, int]
+
+
+def scan_area(
+    cells: Cells, min_x: int, max_x: int, min_y: int, max_y: int
+) -> list[Position]:
+    found = [(x, y) for x, y, _ in cells if min_x <= x <= max_x and min_y <= y <= max_y]
+    return sorted(found, key=lambda position: (position[1], position[0]))
+
+
+def report(name: str, scan_time: float, grid_time: float) -> None:
+    scan_us, grid_us = scan_time * MICROSECONDS, grid_time * MICROSECONDS
+    speedup = scan_time / grid_time
+    print(f"{name:<24} {scan_us:>12.1f} {grid_us:>12.1f} {speedup:>9.0f}x")
+
+
+def build_grid(cells: Cells) -> CellGrid:
+    started = perf_counter()
+    grid = CellGrid()
+    for x, y, cell_id in cells:
+        grid.add(cell_id, x, y)
+    print(f"built index of {len(grid)} cells in {perf_counter() - started:.2f}s")
+    return grid
+
+
+def random_rectangle(size: int) -> Rectangle:
+    x, y = randrange(SIDE - size), randrange(SIDE - size)
+    return x, x + size - 1, y, y + size - 1
+
+
+def bench_area(cells: Cells, grid: CellGrid, size: int) -> None:
+    rectangles = [random_rectangle(size) for _ in range(RECTANGLES)]
+    if scan_area(cells, *rectangles[0]) != grid.area(*rectangles[0]):
+        raise AssertionError(f"Mismatch for {rectangles[0]}")
+    scan_time = timeit(
+        lambda: [scan_area(cells, *r) for r in rectangles[:SCANS]], number=1
+    )
+    grid_time = timeit(lambda: [grid.area(*r) for r in rectangles], number=1)
+    report(f"area {size}x{size}", scan_time / SCANS, grid_time / len(rectangles))
+
+
+def scan_neighbours(cells: Cells, target: tuple[int, int, ObjectId]) -> list[Position]:
+    x, y, _ = target
+    return scan_area(cells, x - 1, x + 1, y - 1, y + 1)
+
+
+def bench_neighbours(cells: Cells, grid: CellGrid) -> None:
+    targets = [cells[randrange(len(cells))] for _ in range(LOOKUPS)]
+    scan_time = timeit(
+        lambda: [scan_neighbours(cells, target) for target in targets[:SCANS]],
+        number=1,
+    )
+    grid_time = timeit(lambda: [grid.neighbours(c) for _, _, c in targets], number=1)
+    report("neighbours", scan_time / SCANS, grid_time / LOOKUPS)
+
+
+def main() -> None:
+    cells: Cells = [(x, y, ObjectId()) for y in range(SIDE) for x in range(SIDE)]
+    grid = build_grid(cells)
+
+    print(f"{'query':<24} {'scan, us':>12} {'grid, us':>12} {'speedup':>10}")
+    for size in VIEWPORTS:
+        bench_area(cells, grid, size)
+    bench_neighbours(cells, grid)
+
+
+if __name__ == "__main__":
+    main()
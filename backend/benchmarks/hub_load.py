@@ -0,0 +1,304 @@
+"""
+End-to-end load test of a running hub with simulated devices
+
+Spawns ``--devices`` temperature and illumination sensors in this process,
+each with its own MQTT connection, pairs every one of them to a fresh cell
+through the hub's REST API (scan -> ready -> pair -> start -> confirm),
+then streams telemetry and watches ``/api/cells/stream`` for the values
+to show up. Reports pairing time, message rates and latency percentiles
+from publish to the cell update
+
+Run with ``python -m benchmarks.hub_load`` from the backend folder against
+a disposable hub: created cells and devices are left in its database
+"""
+import json
+import logging
+from argparse import ArgumentParser, Namespace
+from asyncio import (  # noqa: WPS347
+    Semaphore,
+    Task,
+    create_task,
+    gather,
+    run,
+    sleep,
+    to_thread,
+    wait_for,
+)
+from os import getenv
+from random import randrange
+from statistics import quantiles
+from time import perf_counter
+from typing import Any
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from websockets.client import connect
+
+from common.types import PayloadEncoding
+from devices.base import Device
+from devices.illumination import IlluminationSensor
+from devices.temperature import TemperatureSensor
+
+mqtt_host: str = getenv("MOSQUITTO_HOST", "localhost")
+hub_url: str = getenv("HUB_URL", "http://localhost:8000")
+
+# far away from cells created by hand, so every run gets fresh ones
+FIRST_CELL_X: int = 1000000
+
+DURATION: float = 30
+PARALLEL_REQUESTS: int = 32
+PAIRING_TIMEOUT: float = 600
+
+logging.basicConfig(level=logging.WARNING, force=True)
+
+
+class Probe:
+    """Hands out unique readings and matches them with cell updates"""
+
+    def __init__(self) -> None:
+        self.active: bool = False
+        self.counter: int = 0
+        self.sent: dict[tuple[str, float], float] = {}
+        self.latencies: list[float] = []
+        self.published: int = 0
+        self.applied: int = 0
+
+    def next_value(self, device_id: str) -> float:
+        self.counter += 1
+        value = float(self.counter)
+        if self.active:
+            self.sent[device_id, value] = perf_counter()
+            self.published += 1
+        return value
+
+    def receive(self, device_id: str, value: float) -> None:
+        sent_at = self.sent.pop((device_id, value), None)
+        if sent_at is not None:
+            self.applied += 1
+            self.latencies.append(perf_counter() - sent_at)
+
+
+async def send_probe(device: Device, probe: Probe) -> None:
+    if device.hub_id is not None:
+        value = probe.next_value(device.device_id)
+        await device.publish_reading(value)
+
+
+class TemperatureProbe(TemperatureSensor):
+    def __init__(
+        self, probe: Probe, interval: float, encoding: PayloadEncoding
+    ) -> None:
+        super().__init__()
+        self.probe = probe
+        self.sender_sleep_interval = interval
+        self.encoding = encoding
+
+    async def send_events(self) -> None:
+        await send_probe(self, self.probe)
+
+
+class IlluminationProbe(IlluminationSensor):
+    def __init__(
+        self, probe: Probe, interval: float, encoding: PayloadEncoding
+    ) -> None:
+        super().__init__()
+        self.probe = probe
+        self.sender_sleep_interval = interval
+        self.encoding = encoding
+
+    async def send_events(self) -> None:
+        await send_probe(self, self.probe)
+
+
+async def call_hub(method: str, path: str, body: Any = None, **params: Any) -> Any:
+    url = f"{hub_url}{path}"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    request = Request(url, method=method)  # noqa: S310
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode("utf-8")
+        request.add_header("Content-Type", "application/json")
+
+    def send() -> Any:
+        with urlopen(request, data=data) as response:  # noqa: S310
+            content = response.read()
+        return json.loads(content) if content else None
+
+    return await to_thread(send)
+
+
+async def wait_for_status(device_ids: set[str], status: str) -> dict[str, str]:
+    """Returns database ids of devices once all of them reach the status"""
+    while True:  # noqa: WPS457
+        devices = await call_hub("GET", "/api/devices", status=status)
+        found = {
+            device["device_id"]: device["id"]
+            for device in devices
+            if device["device_id"] in device_ids
+        }
+        if len(found) == len(device_ids):
+            return found
+        await sleep(0.5)
+
+
+async def create_cells(count: int, parallel: int) -> list[str]:
+    base_x = randrange(FIRST_CELL_X, FIRST_CELL_X * 2)
+    semaphore = Semaphore(parallel)
+
+    async def create_cell(i: int) -> str:
+        async with semaphore:
+            cell = await call_hub("POST", "/admin/cells", {"x": base_x + i, "y": 0})
+        return str(cell["id"])
+
+    return await gather(*(create_cell(i) for i in range(count)))
+
+
+async def pair_each(
+    ready: dict[str, str], cells: dict[str, str], parallel: int
+) -> None:
+    semaphore = Semaphore(parallel)
+
+    async def pair(device_id: str, cell_id: str) -> None:
+        async with semaphore:
+            await call_hub(
+                "PUT", f"/api/devices/{ready[device_id]}/pair", None, cell_id=cell_id
+            )
+
+    await gather(*(pair(device_id, cell_id) for cell_id, device_id in cells.items()))
+
+
+async def pair_bulk(ready: dict[str, str], cells: dict[str, str]) -> None:
+    requests = [
+        {"device_id": ready[device_id], "cell_id": cell_id}
+        for cell_id, device_id in cells.items()
+    ]
+    await call_hub("PUT", "/api/devices/pair", requests)
+
+
+async def pair_all(
+    devices: list[Device], cell_ids: list[str], parallel: int, bulk: bool
+) -> dict[str, str]:
+    """Pairs every device to its cell, returns device_id by cell id"""
+    device_ids = {device.device_id for device in devices}
+    await call_hub("POST", "/api/devices/scan")
+    ready = await wait_for_status(device_ids, "ready")
+
+    cells = dict(zip(cell_ids, [device.device_id for device in devices]))
+    if bulk:
+        await pair_bulk(ready, cells)
+    else:
+        await pair_each(ready, cells, parallel)
+    await wait_for_status(device_ids, "paired")
+    return cells
+
+
+def read_update(raw: str | bytes, cells: dict[str, str]) -> tuple[str, float] | None:
+    """Returns the device and its reading from a cell update of a probed cell"""
+    message = json.loads(raw)
+    device_id = cells.get(message.get("id"))
+    if device_id is None:
+        return None
+    changes = message["changes"]
+    value = changes.get("temperature", changes.get("illumination"))
+    return None if value is None else (device_id, value)
+
+
+async def watch_cells(probe: Probe, cells: dict[str, str]) -> None:
+    ws_url = hub_url.replace("http", "ws", 1)
+    async with connect(f"{ws_url}/api/cells/stream", max_size=None) as websocket:
+        async for raw in websocket:
+            update = read_update(raw, cells)
+            if update is not None:
+                probe.receive(*update)
+
+
+def report(name: str, value: float, unit: str) -> None:
+    print(f"{name:<32} {value:>12.2f} {unit}")
+
+
+def make_devices(args: Namespace, probe: Probe) -> list[Device]:
+    devices: list[Device] = []
+    for i in range(args.devices):
+        if i % 2 == 0:
+            devices.append(TemperatureProbe(probe, args.interval, args.encoding))
+        else:
+            devices.append(IlluminationProbe(probe, args.interval, args.encoding))
+        devices[-1].route_all()
+    return devices
+
+
+async def connect_all(devices: list[Device]) -> list[Task[None]]:
+    tasks = [create_task(device.run_durable(mqtt_host=mqtt_host)) for device in devices]
+    while any(device.client is None for device in devices):
+        await sleep(0.5)
+    await sleep(1)  # lets the pairing subscriptions settle
+    return tasks
+
+
+async def pair_timed(
+    devices: list[Device], args: Namespace
+) -> tuple[dict[str, str], float]:
+    """Pairs the devices to new cells, returns the cells and the pairing time"""
+    cell_ids = await create_cells(args.devices, args.parallel)
+    pairing_start = perf_counter()
+    cells = await wait_for(
+        pair_all(devices, cell_ids, args.parallel, args.bulk_pairing),
+        timeout=args.timeout,
+    )
+    return cells, perf_counter() - pairing_start
+
+
+async def stream_readings(
+    probe: Probe, cells: dict[str, str], args: Namespace, tasks: list[Task[None]]
+) -> None:
+    """Probes the cells for the duration, then stops the devices"""
+    watcher = create_task(watch_cells(probe, cells))
+    await sleep(1)
+    probe.active = True
+    await sleep(args.duration)
+    probe.active = False
+    await sleep(args.interval + 1)  # lets in-flight readings arrive
+    for task in (watcher, *tasks):
+        task.cancel()
+
+
+def report_all(args: Namespace, probe: Probe, pairing_time: float) -> None:
+    report("devices", args.devices, "")
+    report("pairing time", pairing_time, "s")
+    report("pairing time per 1000 devices", pairing_time / args.devices * 1000, "s")
+    report("published", probe.published / args.duration, "msg/s")
+    report("applied to cells", probe.applied / args.duration, "msg/s")
+    if len(probe.latencies) >= 2:
+        percentiles = quantiles(probe.latencies, n=100)
+        for percentile in (50, 95, 99):
+            report(f"latency p{percentile}", percentiles[percentile - 1] * 1000, "ms")
+
+
+async def main(args: Namespace) -> None:
+    probe = Probe()
+    devices = make_devices(args, probe)
+    tasks = await connect_all(devices)
+    cells, pairing_time = await pair_timed(devices, args)
+    await stream_readings(probe, cells, args, tasks)
+    report_all(args, probe, pairing_time)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument(
+        "--encoding", type=PayloadEncoding, default=PayloadEncoding.TEXT
+    )
+    parser.add_argument("--interval", type=float, default=1, help="seconds per reading")
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds")
+    parser.add_argument(
+        "--parallel", type=int, default=PARALLEL_REQUESTS, help="REST requests"
+    )
+    parser.add_argument(
+        "--bulk-pairing", action="store_true", help="one PUT /api/devices/pair"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=PAIRING_TIMEOUT, help="for pairing"
+    )
+    run(main(parser.parse_args()))
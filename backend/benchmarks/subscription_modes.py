@@ -0,0 +1,127 @@
+"""
+Compares per-device and wildcard subscription modes against a local mosquitto:
+time to subscribe the whole fleet and steady-state telemetry throughput,
+including messages from devices that are not paired and must be filtered.
+The device mode subscribes through the hub's ``DeviceSubscriptions``, which
+batches topics into large SUBSCRIBE packets
+
+Run with ``python -m benchmarks.subscription_modes`` from the backend folder
+"""
+from asyncio import Task, TimeoutError, create_task, run, sleep, wait_for
+from contextlib import suppress
+from datetime import datetime
+from os import getenv
+from time import perf_counter
+from uuid import uuid4
+
+from asyncio_mqtt import Client
+
+from app.common.subscriptions import DeviceSubscriptions, SubscriptionMode
+from app.models.devices_db import Device, DeviceStatus
+from common.mqtt_service import MQTTService
+from common.types import DeviceType
+
+DEVICE_COUNT: int = int(getenv("BENCHMARK_DEVICES", "5000"))
+UNPAIRED_SHARE: float = 0.1
+MESSAGES_PER_DEVICE: int = 5
+
+mqtt_host: str = getenv("MOSQUITTO_HOST", "localhost")
+device_type: DeviceType = DeviceType.TEMPERATURE_SENSOR
+
+
+def make_devices(device_ids: list[str]) -> list[Device]:
+    now = datetime.utcnow()
+    return [
+        Device(
+            device_id=device_id,
+            device_type=device_type,
+            interval=1,
+            status=DeviceStatus.PAIRED,
+            expiry=now,
+        )
+        for device_id in device_ids
+    ]
+
+
+async def subscribe(client: Client, wildcard: bool, device_ids: list[str]) -> float:
+    service = MQTTService()
+    service.setup(client)
+    mode = SubscriptionMode.WILDCARD if wildcard else SubscriptionMode.DEVICE
+    subscriptions = DeviceSubscriptions(service, mode)
+    devices = make_devices(device_ids)
+
+    start = perf_counter()
+    if wildcard:
+        await client.subscribe(f"{device_type.value}/#")
+    else:
+        # the same batches as when the hub loads or reconnects its devices
+        await subscriptions.subscribe(devices)
+    return perf_counter() - start
+
+
+def make_topics(device_ids: list[str]) -> list[str]:
+    unpaired = [uuid4().hex for _ in range(int(DEVICE_COUNT * UNPAIRED_SHARE))]
+    return [f"{device_type.value}/{device_id}" for device_id in device_ids + unpaired]
+
+
+async def publish_all(topics: list[str]) -> None:
+    async with Client(hostname=mqtt_host) as publisher:
+        for _ in range(MESSAGES_PER_DEVICE):
+            for topic in topics:
+                await publisher.publish(topic, b"21.1")
+
+
+class PairedCounter:
+    def __init__(self, device_ids: list[str]) -> None:
+        self.paired = set(device_ids)
+        self.expected = len(device_ids) * MESSAGES_PER_DEVICE
+        self.handled = 0
+
+    async def consume(self, client: Client) -> None:
+        async with client.messages() as messages:
+            async for message in messages:
+                if message.topic.value.partition("/")[2] not in self.paired:
+                    continue
+                self.handled += 1
+                if self.handled == self.expected:
+                    return
+
+
+async def time_delivery(device_ids: list[str], consumer: Task[None]) -> float:
+    start = perf_counter()
+    await publish_all(make_topics(device_ids))
+    with suppress(TimeoutError):  # qos 0 messages might have been dropped
+        await wait_for(consumer, timeout=60)
+    return perf_counter() - start
+
+
+async def run_mode(wildcard: bool) -> tuple[float, float, int]:
+    device_ids = [uuid4().hex for _ in range(DEVICE_COUNT)]
+    counter = PairedCounter(device_ids)
+    async with Client(hostname=mqtt_host) as hub:
+        consumer = create_task(counter.consume(hub))
+        await sleep(0)  # lets the consumer register before anything is sent
+        return (
+            await subscribe(hub, wildcard, device_ids),
+            await time_delivery(device_ids, consumer),
+            counter.handled,
+        )
+
+
+def report(
+    wildcard: bool, subscribe_time: float, total_time: float, handled: int
+) -> None:
+    mode = "wildcard" if wildcard else "device"
+    rate = handled / total_time
+    print(f"{mode:<10} {subscribe_time:>13.3f} {rate:>12.0f} {handled:>9}")
+
+
+async def main() -> None:
+    print(f"{DEVICE_COUNT} paired devices, {MESSAGES_PER_DEVICE} messages each")
+    print(f"{'mode':<10} {'subscribe, s':>13} {'messages/s':>12} {'handled':>9}")
+    for wildcard in (False, True):
+        report(wildcard, *await run_mode(wildcard))
+
+
+if __name__ == "__main__":
+    run(main())
@@ -0,0 +1,82 @@
+"""
+Compares handler lookup via the compiled topic trie with the linear scan
+over ``Topic.matches`` that ``MQTTService`` used before
+
+Run with ``python -m benchmarks.topic_router`` from the backend folder
+"""
+from timeit import timeit
+from uuid import uuid4
+
+from asyncio_mqtt import Topic
+
+from common.topic_trie import TopicTrie
+
+ROUTE_COUNTS: tuple[int, ...] = (10, 100, 1000)
+LOOKUPS: int = 2000
+MICROSECONDS: float = 1e6
+
+
+def make_routes(count: int) -> list[str]:
+    routes: list[str] = []
+    for i in range(count):
+        match i % 3:
+            case 0:
+                routes.append(f"device-type-{i}/#")
+            case 1:
+                routes.append(f"pairing/ready/{uuid4().hex}")
+            case _:
+                routes.append(f"climate/+/{i}")
+    return routes
+
+
+def make_topics(routes: list[str]) -> list[Topic]:
+    topics: list[Topic] = []
+    for route in routes:
+        topic = route.replace("#", uuid4().hex).replace("+", "cooling")
+        topics.append(Topic(topic))
+    return topics
+
+
+def scan(routes: list[str], topic: Topic) -> list[str]:
+    return [route for route in routes if topic.matches(route)]
+
+
+def build_trie(routes: list[str]) -> TopicTrie[str]:
+    topic_trie: TopicTrie[str] = TopicTrie()
+    for route in routes:
+        topic_trie.insert(route, route)
+    return topic_trie
+
+
+def make_lookups(routes: list[str], topic_trie: TopicTrie[str]) -> list[Topic]:
+    topics = make_topics(routes)
+    for topic in topics:
+        if scan(routes, topic) != topic_trie.match(topic.value):
+            raise AssertionError(f"Mismatch for {topic.value}")
+    return [topics[i % len(topics)] for i in range(LOOKUPS)]
+
+
+def report(count: int, scan_time: float, trie_time: float) -> None:
+    scan_us = scan_time / LOOKUPS * MICROSECONDS
+    trie_us = trie_time / LOOKUPS * MICROSECONDS
+    speedup = scan_time / trie_time
+    print(f"{count:>8} {scan_us:>12.2f} {trie_us:>12.2f} {speedup:>8.1f}x")
+
+
+def bench_routes(count: int) -> None:
+    routes = make_routes(count)
+    topic_trie = build_trie(routes)
+    lookups = make_lookups(routes, topic_trie)
+    scan_time = timeit(lambda: [scan(routes, t) for t in lookups], number=1)
+    trie_time = timeit(lambda: [topic_trie.match(t.value) for t in lookups], number=1)
+    report(count, scan_time, trie_time)
+
+
+def main() -> None:
+    print(f"{'routes':>8} {'scan, us':>12} {'trie, us':>12} {'speedup':>9}")
+    for count in ROUTE_COUNTS:
+        bench_routes(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import json
+from collections.abc import Sequence
+from struct import Struct, error
+from typing import Any
+
+from common.types import PayloadEncoding
+
+SAMPLE: Struct = Struct("<Id")
+SUBJECT: Struct = Struct("<iii")
+
+Sample = tuple[float, float]
+SubjectTuple = tuple[int, int, int]
+
+
+def unpack_all(layout: Struct, payload: bytes) -> list[tuple[Any, ...]]:
+    try:
+        return list(layout.iter_unpack(payload))
+    except error as e:
+        raise ValueError(f"Payload is not a sequence of {layout.format}") from e
+
+
+def encode_samples(samples: Sequence[Sample], encoding: PayloadEncoding) -> bytes:
+    """
+    Encodes a frame of (age, value) readings, age is in seconds before
+    sending so device and hub clocks don't have to agree
+
+    Text is whitespace separated ``value@age_ms`` tokens, with ``@0`` left
+    out so a single fresh reading is a plain decimal. Binary is packed
+    little-endian (uint32 age_ms, double value) records
+    """
+    if encoding == PayloadEncoding.BINARY:
+        return b"".join(SAMPLE.pack(round(age * 1000), value) for age, value in samples)
+    return " ".join(
+        str(value) if round(age * 1000) == 0 else f"{value}@{round(age * 1000)}"
+        for age, value in samples
+    ).encode("utf-8")
+
+
+def decode_samples(payload: bytes, encoding: PayloadEncoding) -> list[Sample]:
+    if encoding == PayloadEncoding.BINARY:
+        return [(age / 1000, value) for age, value in unpack_all(SAMPLE, payload)]
+    samples: list[Sample] = []
+    for token in payload.split():
+        value, _, age = token.partition(b"@")
+        samples.append((int(age or 0) / 1000, float(value)))
+    return samples
+
+
+def encode_subjects(subjects: Sequence[SubjectTuple]) -> bytes:
+    """Binary frame of (x, y, subject_id) int32 triples"""
+    return b"".join(SUBJECT.pack(*subject) for subject in subjects)
+
+
+def are_integers(subjects: list[SubjectTuple]) -> bool:
+    """Exact type check, bools are ints too"""
+    values = (value for subject in subjects for value in subject)
+    return all(type(value) is int for value in values)  # noqa: WPS516
+
+
+def decode_subjects(payload: bytes, encoding: PayloadEncoding) -> list[SubjectTuple]:
+    """
+    Decodes a camera frame into (x, y, subject_id) tuples without building
+    models, text is a JSON list of ``{"x", "y", "subject_id"}`` objects with
+    integer values, anything looser raises ValueError
+    """
+    if encoding == PayloadEncoding.BINARY:
+        return [(x, y, subject_id) for x, y, subject_id in unpack_all(SUBJECT, payload)]
+    try:
+        subjects = [
+            (item["x"], item["y"], item["subject_id"]) for item in json.loads(payload)
+        ]
+    except (TypeError, KeyError) as e:
+        raise ValueError("Payload is not a list of subjects") from e
+    if not are_integers(subjects):
+        raise ValueError("Subject coordinates and ids must be integers")
+    return subjects
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram, observing is a bisect and two additions"""
+
+    __slots__ = ("buckets", "counts", "count", "total")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: list[int] = [0 for _ in range(len(buckets) + 1)]
+        self.count: int = 0
+        self.total: float = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+
+Labels = dict[str, str]
+
+LABEL_ESCAPES: dict[int, str] = str.maketrans({"\\": r"\\", '"': r"\"", "\n": r"\n"})
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{key}="{value.translate(LABEL_ESCAPES)}"' for key, value in labels.items()
+    )
+    return f"{{{pairs}}}"
+
+
+class MetricsText:
+    """Builds the Prometheus text exposition format"""
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+
+    def describe(self, name: str, kind: str, description: str) -> None:
+        self.lines.append(f"# HELP {name} {description}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels: str) -> None:
+        self.lines.append(f"{name}{format_labels(labels)} {value}")
+
+    def histogram(self, name: str, histogram: Histogram, **labels: str) -> None:
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+            cumulative += count
+            self.sample(f"{name}_bucket", cumulative, **labels, le=str(bound))
+        self.sample(f"{name}_sum", histogram.total, **labels)
+        self.sample(f"{name}_count", histogram.count, **labels)
+
+    def samples(self, name: str, samples: Iterable[tuple[Labels, float]]) -> None:
+        for labels, value in samples:
+            self.sample(name, value, **labels)
+
+    def histograms(
+        self, name: str, histograms: Iterable[tuple[Labels, Histogram]]
+    ) -> None:
+        for labels, histogram in histograms:
+            self.histogram(name, histogram, **labels)
+
+    def gauge(self, name: str, description: str, value: float) -> None:
+        self.describe(name, "gauge", description)
+        self.sample(name, value)
+
+    def counter(self, name: str, description: str, value: float) -> None:
+        self.describe(name, "counter", description)
+        self.sample(name, value)
+
+    def render(self) -> str:
+        return "".join(f"{line}\n" for line in self.lines)
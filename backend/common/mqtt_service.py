@@ -1,17 +1,25 @@
 import logging
-from asyncio import sleep
-from collections.abc import Callable
+from asyncio import CancelledError, Event, Semaphore, Task, create_task, sleep
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from time import perf_counter
 from typing import Any, Protocol
 
 from asyncio_mqtt import Client, Message, MqttError
 from asyncio_mqtt.types import PayloadType
 
+from common.metrics import Histogram
+from common.topic_trie import TopicTrie
+
 
 class MQTTHandlerProtocol(Protocol):
     async def __call__(self, message: Message) -> None:  # noqa: U100
         pass
 
 
+ConnectCallback = Callable[[], Awaitable[None]]
+
+
 class MQTTRouter:
     def __init__(self) -> None:
         self.subscriptions: list[str] = []
@@ -29,30 +37,146 @@ class MQTTRouter:
             self.subscribe(topic)
 
         def route_wrapper(handler: MQTTHandlerProtocol) -> None:
-            self.handlers[topic] = handler
+            self.add_handler(topic, handler)
 
         return route_wrapper
 
+    def add_handler(self, topic: str, handler: MQTTHandlerProtocol) -> None:
+        self.handlers[topic] = handler
+
 
 class MQTTService(MQTTRouter):
-    def __init__(self) -> None:
+    def __init__(
+        self, concurrency: int = 1, queue_limit: int = 0, slow_threshold: float = 0
+    ) -> None:
+        """
+        With concurrency above one messages are dispatched to handlers in
+        parallel, messages for the same topic are still handled in order.
+        Reading from the broker pauses once queue_limit messages are waiting
+        (zero disables the limit). Handlers running longer than slow_threshold
+        seconds are logged (zero disables the logging)
+        """
         super().__init__()
         self.client: Client | None = None
+        self._connect_callbacks: list[ConnectCallback] = []
+        self._topic_trie: TopicTrie[tuple[str, MQTTHandlerProtocol]] | None = None
+
+        self.handler_latency: dict[str, Histogram] = {}
+        self.handler_errors: Counter[str] = Counter()
+        self.publish_latency: Histogram = Histogram()
+        self.disconnects: int = 0
+        self.slow_threshold = slow_threshold
+
+        self._concurrency = concurrency
+        self._queue_limit = queue_limit
+        self._semaphore = Semaphore(concurrency)
+        self._queue_drained: Event = Event()
+        self._topic_queues: dict[str, deque[Message]] = {}
+        self._dispatch_tasks: set[Task[None]] = set()
+        self._queue_depth: int = 0
+        self._in_flight: int = 0
+
+    def add_handler(self, topic: str, handler: MQTTHandlerProtocol) -> None:
+        super().add_handler(topic, handler)
+        self._topic_trie = None
 
     def include_router(self, router: MQTTRouter) -> None:
         self.subscriptions.extend(router.subscriptions)
         self.handlers.update(router.handlers)
+        self._topic_trie = None
+
+    def compile_handlers(self) -> TopicTrie[tuple[str, MQTTHandlerProtocol]]:
+        topic_trie: TopicTrie[tuple[str, MQTTHandlerProtocol]] = TopicTrie()
+        for topic, handler in self.handlers.items():
+            topic_trie.insert(topic, (topic, handler))
+        return topic_trie
 
     def setup(self, client: Client) -> None:
         self.client = client
 
+    def on_connect(self, callback: ConnectCallback) -> ConnectCallback:
+        """Registers a callback to run after every (re)connection to the broker"""
+        self._connect_callbacks.append(callback)
+        return callback
+
+    async def _run_connect_callbacks(self) -> None:
+        for callback in self._connect_callbacks:
+            try:
+                await callback()
+            # connection errors have to reach run_durable to reconnect
+            except MqttError:  # noqa: WPS329
+                raise
+            except Exception as e:
+                logging.error(f"Connect callback '{callback}' exited", exc_info=e)
+
     async def _handle_one(self, message: Message) -> None:
-        for topic, handler in self.handlers.items():
-            if message.topic.matches(topic):
-                try:
-                    await handler(message)
-                except Exception as e:
-                    logging.error(f"Handle for topic '{topic}' exited", exc_info=e)
+        if self._topic_trie is None:
+            self._topic_trie = self.compile_handlers()
+        for topic, handler in self._topic_trie.match(message.topic.value):
+            started = perf_counter()
+            try:
+                await handler(message)
+            except Exception as e:
+                self.handler_errors[topic] += 1
+                logging.error(f"Handle for topic '{topic}' exited", exc_info=e)
+            latency = self.handler_latency.get(topic)
+            if latency is None:
+                latency = Histogram()
+                self.handler_latency[topic] = latency
+            elapsed = perf_counter() - started
+            latency.observe(elapsed)
+            if 0 < self.slow_threshold < elapsed:
+                self._warn_slow(topic, message.topic.value, elapsed)
+
+    def _warn_slow(self, topic: str, received: str, elapsed: float) -> None:
+        took = f"{elapsed * 1000:.0f} ms"
+        logging.warning(f"Slow handler for '{topic}' on {received}: {took}")
+
+    async def _handle_limited(self, message: Message) -> None:
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                await self._handle_one(message)
+            finally:
+                self._in_flight -= 1
+
+    async def _handle_topic_queue(self, topic: str) -> None:
+        queue = self._topic_queues[topic]
+        try:
+            while queue:
+                message = queue.popleft()
+                self._queue_depth -= 1
+                if self._queue_depth < self._queue_limit:
+                    self._queue_drained.set()
+                await self._handle_limited(message)
+        finally:
+            self._queue_depth -= len(queue)
+            del self._topic_queues[topic]
+
+    async def _dispatch(self, message: Message) -> None:
+        if 0 < self._queue_limit <= self._queue_depth:
+            self._queue_drained.clear()
+            await self._queue_drained.wait()
+
+        self._queue_depth += 1
+        topic = message.topic.value
+        queue = self._topic_queues.get(topic)
+        if queue is not None:
+            queue.append(message)
+            return
+
+        self._topic_queues[topic] = deque([message])
+        task = create_task(self._handle_topic_queue(topic))
+        self._dispatch_tasks.add(task)
+        task.add_done_callback(self._dispatch_tasks.discard)
+
+    def dispatch_stats(self) -> dict[str, int]:
+        return {
+            "concurrency": self._concurrency,
+            "queue_depth": self._queue_depth,
+            "in_flight": self._in_flight,
+            "active_topics": len(self._topic_queues),
+        }
 
     async def listen(self, **subscribe_kwargs: Any) -> None:
         if self.client is None:
@@ -60,9 +184,18 @@ class MQTTService(MQTTRouter):
         async with self.client.messages() as messages:
             for subscription in self.subscriptions:
                 await self.client.subscribe(subscription, **subscribe_kwargs)
+            await self._run_connect_callbacks()
 
-            async for message in messages:
-                await self._handle_one(message)
+            try:
+                async for message in messages:
+                    if self._concurrency > 1:
+                        await self._dispatch(message)
+                    else:
+                        await self._handle_one(message)
+            except CancelledError:
+                for task in self._dispatch_tasks:
+                    task.cancel()
+                raise
 
     async def run_durable(
         self,
@@ -81,6 +214,7 @@ class MQTTService(MQTTRouter):
                     await self.listen(**subscribe_kwargs)
             except MqttError:
                 reconnecting = True
+                self.disconnects += 1
                 logging.error(f"Connection lost. Reconnecting in {interval} seconds...")
                 self.client = None
                 await sleep(interval)
@@ -88,4 +222,6 @@ class MQTTService(MQTTRouter):
     async def publish(self, topic: str, payload: PayloadType, **kwargs: Any) -> None:
         if self.client is None:
             raise EnvironmentError("Client was not setup")
+        started = perf_counter()
         await self.client.publish(topic, payload, **kwargs)
+        self.publish_latency.observe(perf_counter() - started)
@@ -0,0 +1,75 @@
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+SINGLE_LEVEL: str = "+"
+MULTI_LEVEL: str = "#"
+
+
+class TopicNode(Generic[T]):
+    __slots__ = ("children", "values", "rest_values")
+
+    def __init__(self) -> None:
+        self.children: dict[str, TopicNode[T]] = {}
+        self.values: list[tuple[int, T]] = []
+        self.rest_values: list[tuple[int, T]] = []
+
+
+def descend(
+    nodes: list[TopicNode[T]], level: str, found: list[tuple[int, T]]
+) -> list[TopicNode[T]]:
+    """Children matching the level, ``#`` filters of the nodes go to ``found``"""
+    next_nodes: list[TopicNode[T]] = []
+    for node in nodes:
+        found.extend(node.rest_values)
+        exact = node.children.get(level)
+        if exact is not None:
+            next_nodes.append(exact)
+        single = node.children.get(SINGLE_LEVEL)
+        if single is not None:
+            next_nodes.append(single)
+    return next_nodes
+
+
+class TopicTrie(Generic[T]):
+    """
+    Compiled set of MQTT topic filters, supports ``+`` and ``#`` wildcards
+
+    Matching follows ``asyncio_mqtt.Topic.matches``, so ``a/#`` matches
+    ``a/b`` and deeper topics, but not ``a`` itself. Lookup cost depends
+    on the depth of the topic, not on the number of inserted filters
+    """
+
+    def __init__(self) -> None:
+        self.root: TopicNode[T] = TopicNode()
+        self.size: int = 0
+
+    def insert(self, wildcard: str, value: T) -> None:
+        levels = wildcard.split("/")
+        if levels[0] == "$share":
+            levels = levels[2:]
+
+        node = self.root
+        for level in levels:
+            if level == MULTI_LEVEL:
+                node.rest_values.append((self.size, value))
+                break
+            node = node.children.setdefault(level, TopicNode())
+        else:
+            node.values.append((self.size, value))
+        self.size += 1
+
+    def match(self, topic: str) -> list[T]:
+        found: list[tuple[int, T]] = []
+        nodes: list[TopicNode[T]] = [self.root]
+        for level in topic.split("/"):
+            nodes = descend(nodes, level, found)
+            if not nodes:
+                break
+        else:
+            for node in nodes:
+                found.extend(node.values)
+
+        if len(found) > 1:
+            found.sort(key=lambda entry: entry[0])
+        return [value for _, value in found]
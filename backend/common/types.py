@@ -10,7 +10,13 @@ class DeviceType(str, Enum):
     ECHO = "echo"
 
 
+class PayloadEncoding(str, Enum):
+    TEXT = "text"
+    BINARY = "binary"
+
+
 class DeviceInfo(BaseModel):
     id: str  # noqa: VNE003
     type: DeviceType  # noqa: VNE003
     interval: float
+    encoding: PayloadEncoding = PayloadEncoding.TEXT
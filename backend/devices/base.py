@@ -1,29 +1,44 @@
 import logging
 from asyncio import TaskGroup, sleep
+from time import monotonic
 from typing import Any
 from uuid import uuid4
 
 from asyncio_mqtt import Message
 
+from common.codecs import encode_samples
 from common.mqtt_service import MQTTService
-from common.types import DeviceInfo, DeviceType
+from common.types import DeviceInfo, DeviceType, PayloadEncoding
 from common.utils import id_from_message
+from devices.world import WorldModel
 
 
 class Device(MQTTService):
     device_type: DeviceType
     sender_sleep_interval: float = 1
+    encoding: PayloadEncoding = PayloadEncoding.TEXT
+    batch_size: int = 1
+    batch_window: float = 0
 
     def __init__(self, device_id: str | None = None) -> None:
         super().__init__()
         self.hub_id: str | None = None
         self.device_id: str = device_id or uuid4().hex
+        self.world: WorldModel | None = None
+        self.world_index: int = 0
+        self.pending_samples: list[tuple[float, float]] = []
+
+    def attach(self, world: WorldModel, index: int) -> None:
+        """Makes the device read its environment from a shared world cell"""
+        self.world = world
+        self.world_index = index
 
     def device_info(self) -> DeviceInfo:
         return DeviceInfo(
             id=self.device_id,
             type=self.device_type,
             interval=self.sender_sleep_interval,
+            encoding=self.encoding,
         )
 
     async def pairing_scan_ready(self, message: Message) -> None:
@@ -50,6 +65,27 @@ class Device(MQTTService):
         self.route(f"pairing/start/{self.device_id}")(self.pairing_connect)
         self.route(f"pairing/cancel/{self.device_id}")(self.pairing_cancel)
 
+    def is_batch_ready(self, now: float) -> bool:
+        if len(self.pending_samples) >= self.batch_size:
+            return True
+        return 0 < self.batch_window <= now - self.pending_samples[0][0]
+
+    async def publish_reading(self, value: float) -> None:
+        """
+        Buffers the reading and sends the buffer as one frame once it holds
+        ``batch_size`` readings or the oldest one is ``batch_window`` seconds old
+        """
+        now = monotonic()
+        self.pending_samples.append((now, value))
+        if not self.is_batch_ready(now):
+            return
+        samples = [(now - taken, reading) for taken, reading in self.pending_samples]
+        self.pending_samples = []
+        await self.publish(
+            f"{self.device_type.value}/{self.device_id}",
+            encode_samples(samples, self.encoding),
+        )
+
     async def send_events(self) -> None:
         raise NotImplementedError
 
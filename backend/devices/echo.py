@@ -14,8 +14,8 @@ logging.basicConfig(level=logging.INFO)
 class EchoDevice(Device):
     device_type = DeviceType.ECHO
 
-    def __init__(self) -> None:
-        super().__init__("echo")
+    def __init__(self, device_id: str = "echo") -> None:
+        super().__init__(device_id)
         self.payload: PayloadType = None
 
     async def handle_echo(self, message: Message) -> None:
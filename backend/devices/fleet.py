@@ -0,0 +1,113 @@
+import logging
+import sys
+from asyncio import TaskGroup, gather, get_running_loop, run, sleep
+from collections import defaultdict
+from os import getenv
+from pathlib import Path
+from typing import Any
+
+from asyncio_mqtt import Client
+
+from common.mqtt_service import MQTTHandlerProtocol, MQTTService
+from common.topic_trie import TopicTrie
+from devices.base import Device
+from devices.fleet_spec import FleetSpec
+
+# per-device logs of the sensor modules are too chatty for a whole fleet
+logging.basicConfig(level=getenv("LOG_LEVEL", "WARNING"), force=True)
+
+
+class FleetRunner(MQTTService):
+    """
+    Hosts many virtual devices over a single MQTT connection
+
+    Per-device subscriptions are collapsed into ``+`` wildcards and routed
+    to the devices in-process, devices with equal intervals send their
+    events in one tick
+    """
+
+    def __init__(self, devices: list[Device]) -> None:
+        super().__init__()
+        self.devices = devices
+        for device in devices:
+            for subscription in device.subscriptions:
+                self.subscribe(self.collapse(device, subscription))
+        self.subscriptions = list(dict.fromkeys(self.subscriptions))
+
+    @staticmethod
+    def collapse(device: Device, subscription: str) -> str:
+        prefix, _, last_level = subscription.rpartition("/")
+        if prefix != "" and last_level == device.device_id:
+            return f"{prefix}/+"
+        return subscription
+
+    def compile_handlers(self) -> TopicTrie[tuple[str, MQTTHandlerProtocol]]:
+        topic_trie = super().compile_handlers()
+        for device in self.devices:
+            for topic, handler in device.handlers.items():
+                topic_trie.insert(topic, (topic, handler))
+        return topic_trie
+
+    def setup(self, client: Client) -> None:
+        super().setup(client)
+        for device in self.devices:
+            device.setup(client)
+
+    async def send_group(self, devices: list[Device]) -> None:
+        results = await gather(
+            *(device.send_events() for device in devices),
+            return_exceptions=True,
+        )
+        for device, result in zip(devices, results):
+            if isinstance(result, Exception):
+                logging.error(f"Sending for {device.device_id} failed", exc_info=result)
+
+    def group_by_interval(self) -> dict[float, list[Device]]:
+        groups: dict[float, list[Device]] = defaultdict(list)
+        for device in self.devices:
+            groups[device.sender_sleep_interval].append(device)
+        return groups
+
+    async def tick_loop(self) -> None:
+        groups = self.group_by_interval()
+        if not groups:
+            return
+
+        loop = get_running_loop()
+        next_ticks = {interval: loop.time() for interval in groups}
+
+        def next_tick(interval: float) -> float:
+            return next_ticks[interval]
+
+        while True:  # noqa: WPS457
+            interval = min(next_ticks, key=next_tick)
+            delay = next_ticks[interval] - loop.time()
+            if delay > 0:
+                await sleep(delay)
+            await self.send_group(groups[interval])
+            next_ticks[interval] = max(next_ticks[interval] + interval, loop.time())
+
+    async def listen(self, **subscribe_kwargs: Any) -> None:
+        async with TaskGroup() as task_group:
+            task_group.create_task(super().listen(**subscribe_kwargs))
+            task_group.create_task(self.tick_loop())
+
+
+async def run_fleet(spec: FleetSpec, mqtt_host: str) -> None:
+    world = spec.create_world()
+    devices = spec.create_devices(world)
+    runners = [
+        FleetRunner(devices[i :: spec.connections])  # noqa: E203
+        for i in range(spec.connections)
+    ]
+    logging.warning(f"Running {len(devices)} devices over {len(runners)} connections")
+    tasks = [runner.run_durable(mqtt_host=mqtt_host) for runner in runners]
+    if world is not None:
+        tasks.append(world.run())
+    await gather(*tasks)
+
+
+if __name__ == "__main__":
+    mqtt_host: str = getenv("MOSQUITTO_HOST", "localhost")
+    spec_path = Path(sys.argv[1] if len(sys.argv) > 1 else "devices/fleet.json")
+    run(run_fleet(FleetSpec.parse_file(spec_path), mqtt_host))
@@ -0,0 +1,65 @@
+from collections.abc import Mapping
+from types import MappingProxyType
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from common.types import DeviceType, PayloadEncoding
+from devices.base import Device
+from devices.echo import EchoDevice
+from devices.illumination import IlluminationSensor
+from devices.temperature import TemperatureSensor
+from devices.world import WorldModel, WorldSpec
+
+DEVICE_CLASSES: Mapping[DeviceType, type[Device]] = MappingProxyType(
+    {
+        DeviceType.TEMPERATURE_SENSOR: TemperatureSensor,
+        DeviceType.ILLUMINATION_SENSOR: IlluminationSensor,
+        DeviceType.ECHO: EchoDevice,
+    }
+)
+
+
+class DeviceGroup(BaseModel):
+    type: DeviceType  # noqa: VNE003
+    count: int = 1
+    interval: float | None = None
+    encoding: PayloadEncoding | None = None
+    batch_size: int | None = None
+    batch_window: float | None = None
+
+    def create_device(self) -> Device:
+        """Device of the group type with a unique id and the group settings"""
+        device_class = DEVICE_CLASSES.get(self.type)
+        if device_class is None:
+            raise ValueError(f"Device type {self.type.value} can't be simulated")
+        device = device_class(uuid4().hex)
+        if self.interval is not None:
+            device.sender_sleep_interval = self.interval
+        if self.encoding is not None:
+            device.encoding = self.encoding
+        if self.batch_size is not None:
+            device.batch_size = self.batch_size
+        if self.batch_window is not None:
+            device.batch_window = self.batch_window
+        return device
+
+
+class FleetSpec(BaseModel):
+    connections: int = 1
+    devices: list[DeviceGroup]
+    world: WorldSpec | None = None
+
+    def create_world(self) -> WorldModel | None:
+        return None if self.world is None else WorldModel(self.world)
+
+    def create_devices(self, world: WorldModel | None = None) -> list[Device]:
+        devices: list[Device] = []
+        for group in self.devices:
+            for _ in range(group.count):
+                device = group.create_device()
+                if world is not None:
+                    device.attach(world, len(devices) % len(world))
+                device.route_all()
+                devices.append(device)
+        return devices
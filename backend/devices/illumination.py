@@ -2,7 +2,9 @@ import logging
 from asyncio import run
 from os import getenv
 
-from common.types import DeviceType
+from asyncio_mqtt import Message
+
+from common.types import DeviceType, PayloadEncoding
 from devices.base import Device
 
 logging.basicConfig(level=logging.INFO)
@@ -11,24 +13,39 @@ logging.basicConfig(level=logging.INFO)
 class IlluminationSensor(Device):
     device_type = DeviceType.ILLUMINATION_SENSOR
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, device_id: str | None = None) -> None:
+        super().__init__(device_id)
         self.illumination: float = 1000
 
+    async def handle_light_on(self, message: Message) -> None:  # noqa: U100
+        if self.world is not None:
+            self.world.set_lamp(self.world_index, self.world.spec.lamp)
+
+    async def handle_light_off(self, message: Message) -> None:  # noqa: U100
+        if self.world is not None:
+            self.world.set_lamp(self.world_index, 0)
+
+    def route_all(self) -> None:
+        super().route_all()
+        self.route(f"light/on/{self.device_id}")(self.handle_light_on)
+        self.route(f"light/off/{self.device_id}")(self.handle_light_off)
+
     async def send_events(self) -> None:
-        self.illumination = await self.request_grpc(
-            "GetIllumination",
-            self.illumination,
-        )
+        if self.world is None:
+            self.illumination = await self.request_grpc(
+                "GetIllumination",
+                self.illumination,
+            )
+        else:
+            self.illumination = self.world.illumination[self.world_index]
         if self.hub_id is not None:
             logging.info(f"Sending temperature: {self.illumination}")
-            await self.publish(
-                f"illumination-sensor/{self.device_id}", self.illumination
-            )
+            await self.publish_reading(self.illumination)
 
 
 if __name__ == "__main__":
     mqtt_host: str = getenv("MOSQUITTO_HOST", "localhost")
     mqtt_service: IlluminationSensor = IlluminationSensor()
+    mqtt_service.encoding = PayloadEncoding(getenv("PAYLOAD_ENCODING", "text"))
     mqtt_service.route_all()
     run(mqtt_service.run_durable(mqtt_host=mqtt_host))
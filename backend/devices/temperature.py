@@ -4,28 +4,35 @@ from os import getenv
 
 from asyncio_mqtt import Message
 
-from common.types import DeviceType
+from common.types import DeviceType, PayloadEncoding
 from devices.base import Device
 
 logging.basicConfig(level=logging.INFO)
 
+CLIMATE_DELTA: float = 0.01
+
 
 class TemperatureSensor(Device):
     device_type = DeviceType.TEMPERATURE_SENSOR
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, device_id: str | None = None) -> None:
+        super().__init__(device_id)
         self.temperature: float = 21.1
         self.delta: float = 0
 
+    def apply_delta(self, delta: float) -> None:
+        self.delta = delta
+        if self.world is not None:
+            self.world.set_delta(self.world_index, delta)
+
     async def handle_cooling(self, _: Message) -> None:
-        self.delta = -0.01
+        self.apply_delta(-CLIMATE_DELTA)
 
     async def handle_heating(self, _: Message) -> None:
-        self.delta = 0.01
+        self.apply_delta(CLIMATE_DELTA)
 
     async def handle_ready(self, _: Message) -> None:
-        self.delta = 0
+        self.apply_delta(0)
 
     def route_all(self) -> None:
         super().route_all()
@@ -34,18 +41,22 @@ class TemperatureSensor(Device):
         self.route(f"climate/ready/{self.device_id}")(self.handle_ready)
 
     async def send_events(self) -> None:
-        self.temperature = await self.request_grpc(
-            "GetAirTemperature",
-            self.temperature,
-            self.delta,
-        )
+        if self.world is None:
+            self.temperature = await self.request_grpc(
+                "GetAirTemperature",
+                self.temperature,
+                self.delta,
+            )
+        else:
+            self.temperature = self.world.temperature[self.world_index]
         if self.hub_id is not None:
             logging.info(f"Sending temperature: {self.temperature}")
-            await self.publish(f"temperature-sensor/{self.device_id}", self.temperature)
+            await self.publish_reading(self.temperature)
 
 
 if __name__ == "__main__":
     mqtt_host: str = getenv("MOSQUITTO_HOST", "localhost")
     mqtt_service: TemperatureSensor = TemperatureSensor()
+    mqtt_service.encoding = PayloadEncoding(getenv("PAYLOAD_ENCODING", "text"))
     mqtt_service.route_all()
     run(mqtt_service.run_durable(mqtt_host=mqtt_host))
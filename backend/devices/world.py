@@ -0,0 +1,109 @@
+from array import array
+from asyncio import sleep, to_thread  # noqa: WPS347
+from itertools import repeat
+
+from pydantic import BaseModel
+
+
+class WorldSpec(BaseModel):
+    width: int
+    height: int
+    temperature: float = 21.1
+    illumination: float = 1000
+    # lux a cell's light adds, keep it under the hub's on/off hysteresis band
+    lamp: float = 400
+    diffusion: float = 0
+    interval: float = 1
+
+
+def right_differences(values: list[float], width: int) -> list[float]:
+    """Differences with the right neighbour, zero at the end of every row"""
+    right = [after - before for before, after in zip(values, values[1:])]
+    right.append(0)
+    for index in range(width - 1, len(right), width):
+        right[index] = 0
+    return right
+
+
+def bottom_differences(values: list[float], width: int) -> list[float]:
+    """Differences with the bottom neighbour, zero on the last row"""
+    bottom = [after - before for before, after in zip(values, values[width:])]
+    bottom.extend(repeat(0, width))
+    return bottom
+
+
+def exchange(
+    values: list[float],
+    right: list[float],
+    bottom: list[float],
+    width: int,
+    rate: float,
+) -> list[float]:
+    """Moves ``rate`` of the difference with every neighbour into each cell"""
+    # the left and top differences are the right and bottom ones shifted
+    return [
+        value + (r - l + b - t) * rate
+        for value, r, l, b, t in zip(
+            values,
+            right,
+            [0, *right[:-1]],
+            bottom,
+            [*repeat(0, width), *bottom[:-width]],
+        )
+    ]
+
+
+class WorldModel:
+    """
+    Physical state of the whole map, advanced for all cells every tick
+
+    Climate commands set a per-cell temperature delta, applied every step
+    together with optional diffusion between neighbouring cells (``diffusion``
+    is the share of the difference with each neighbour exchanged per step).
+    Light commands add or remove the ``lamp`` lux of a cell. Steps are
+    whole-list comprehensions run in a worker thread: a 1000x1000 map takes
+    about 0.15 s per step, 0.5 s with diffusion, and holds the GIL meanwhile,
+    so larger maps need a longer ``interval``
+    """
+
+    def __init__(self, spec: WorldSpec) -> None:
+        self.spec = spec
+        self.width = spec.width
+        self.height = spec.height
+        size = spec.width * spec.height
+        self.temperature: array[float] = array("d", [spec.temperature]) * size
+        self.illumination: array[float] = array("d", [spec.illumination]) * size
+        self._deltas: array[float] = array("d", [0]) * size
+        self._lamps: array[float] = array("d", [0]) * size
+
+    def __len__(self) -> int:
+        return len(self.temperature)
+
+    def index(self, x: int, y: int) -> int:
+        return y * self.width + x
+
+    def set_delta(self, index: int, delta: float) -> None:
+        self._deltas[index] = delta
+
+    def set_lamp(self, index: int, lamp: float) -> None:
+        self.illumination[index] += lamp - self._lamps[index]
+        self._lamps[index] = lamp
+
+    def diffuse(self, values: list[float]) -> list[float]:
+        right = right_differences(values, self.width)
+        bottom = bottom_differences(values, self.width)
+        return exchange(values, right, bottom, self.width, self.spec.diffusion)
+
+    def step(self) -> None:
+        values = [
+            temperature + delta
+            for temperature, delta in zip(self.temperature, self._deltas)
+        ]
+        if self.spec.diffusion != 0:
+            values = self.diffuse(values)
+        self.temperature = array("d", values)
+
+    async def run(self) -> None:
+        while True:  # noqa: WPS457
+            await to_thread(self.step)
+            await sleep(self.spec.interval)